@@ -10,3 +10,12 @@ makedir='${root}/makefiles'
 #cvs_update='cvs update -dP'
 #nproc_mpi=1
 #mpi_prefix='mpirun -np %i'
+#driver_pool=True
+#timeout_factor=10.0
+#timeout_floor=60.0
+#result_cache_size=1000
+#history_window=10
+#history_threshold=5.0
+#dedup=True
+#compress_outputs=True
+#link_inputs=True
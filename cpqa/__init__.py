@@ -18,14 +18,26 @@
 #
 # --
 
+from cpqa.cache import *
 from cpqa.compiler import *
 from cpqa.config import *
+from cpqa.coverage import *
 from cpqa.data import *
+from cpqa.harvest import *
+from cpqa.history import *
 from cpqa.importer import *
 from cpqa.io import *
+from cpqa.launcher import *
 from cpqa.log import *
+from cpqa.merge import *
+from cpqa.objects import *
+from cpqa.output import *
+from cpqa.refcache import *
 from cpqa.runner import *
+from cpqa.scheduler import *
+from cpqa.selection import *
 from cpqa.shell import *
+from cpqa.store import *
 from cpqa.tests import *
 from cpqa.timer import *
 from cpqa.work import *
@@ -0,0 +1,147 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, shutil, hashlib
+
+from cpqa.output import find_output
+from cpqa.shell import checksum, du, copy_file, load_pickle, dump_pickle
+
+
+__all__ = ['ResultCache']
+
+
+class ResultCache(object):
+    '''Outputs and results of test jobs from previous runs.
+
+       A job is identified by a checksum of everything that determines its
+       outcome: the binary, the MPI prefix, the input and its related files,
+       the reference result and the identifiers of the jobs it depends on. Each
+       job is stored in a subdirectory of the cache directory. The
+       modification time of a subdirectory is updated when the job is used,
+       such that the least recently used jobs can be removed when the cache
+       grows too large.
+    '''
+    def __init__(self, config):
+        self.config = config
+        self.cachedir = config.cachedir
+        if not os.path.isdir(self.cachedir):
+            os.mkdir(self.cachedir)
+        # The binary may be a command with arguments, e.g. with valgrind.
+        m = hashlib.md5(self.config.bin)
+        for word in self.config.bin.split():
+            if os.path.isfile(word):
+                m.update(checksum(word))
+        self.bin_key = m.hexdigest()
+
+    def compute_keys(self, test_inputs):
+        '''Assign the attribute cache_key to the test inputs'''
+        for test_input in test_inputs:
+            test_input.cache_key = None
+        for test_input in test_inputs:
+            self._compute_key(test_input)
+
+    def _compute_key(self, test_input):
+        if test_input.cache_key is not None:
+            return test_input.cache_key
+        indir = self.config.indir
+        m = hashlib.md5(self.bin_key)
+        m.update('\n%s' % self.config.get_mpi_prefix(test_input))
+        m.update('\n%s %s' % (test_input.path_inp, checksum(os.path.join(indir, test_input.path_inp))))
+        for path_extra in sorted(test_input.paths_extra):
+            m.update('\n%s %s' % (path_extra, checksum(os.path.join(indir, path_extra))))
+        path_ref = os.path.join(self.config.refdir, test_input.path_pp)
+        if os.path.isfile(path_ref):
+            m.update('\nref %s' % checksum(path_ref))
+        for depend in sorted(test_input.depends, key=(lambda ti: ti.path_inp)):
+            m.update('\ndepends %s' % self._compute_key(depend))
+        test_input.cache_key = m.hexdigest()
+        return test_input.cache_key
+
+    def _get_paths(self, test_input):
+        return [
+            test_input.path_inp, test_input.path_out, test_input.path_stdout,
+            test_input.path_stderr, test_input.path_pp
+        ]
+
+    def lookup(self, test_input):
+        '''Return True when the cache contains the job'''
+        entry = os.path.join(self.cachedir, test_input.cache_key)
+        return os.path.isfile(os.path.join(entry, os.path.basename(test_input.path_pp)))
+
+    def restore(self, test_input, tstdir):
+        '''Copy the outputs of a cached job into the test directory
+
+           The test result in the test directory gets the cached flag.
+        '''
+        entry = os.path.join(self.cachedir, test_input.cache_key)
+        for path in self._get_paths(test_input):
+            dst_dir = os.path.join(tstdir, os.path.dirname(path))
+            if not os.path.isdir(dst_dir):
+                os.makedirs(dst_dir)
+            copy_file(find_output(os.path.join(entry, os.path.basename(path))), dst_dir)
+        # Mark the entry as recently used.
+        os.utime(entry, None)
+        path_pp = os.path.join(tstdir, test_input.path_pp)
+        test_result = load_pickle(path_pp)
+        if test_result is None:
+            raise IOError('Could not load the cached result %s.' % path_pp)
+        test_result.flags['cached'] = True
+        dump_pickle(path_pp, test_result)
+        return test_result
+
+    def store(self, test_input, tstdir):
+        '''Copy the outputs of a job from the test directory into the cache'''
+        entry = os.path.join(self.cachedir, test_input.cache_key)
+        if os.path.isdir(entry):
+            return
+        # Fill a temporary directory first, such that incomplete entries are
+        # never used.
+        entry_tmp = '%s.%i' % (entry, os.getpid())
+        os.mkdir(entry_tmp)
+        for path in self._get_paths(test_input):
+            src_path = find_output(os.path.join(tstdir, path))
+            if os.path.isfile(src_path):
+                shutil.copy(src_path, entry_tmp)
+        os.rename(entry_tmp, entry)
+
+    def evict(self, max_size):
+        '''Remove the least recently used jobs until the cache is small enough
+
+           *Arguments:*
+
+           max_size
+                The maximum size of the cache in bytes.
+        '''
+        entries = []
+        total = 0
+        for name in os.listdir(self.cachedir):
+            entry = os.path.join(self.cachedir, name)
+            if not os.path.isdir(entry):
+                continue
+            size = du(entry)
+            entries.append((os.path.getmtime(entry), size, entry))
+            total += size
+        entries.sort()
+        for mtime, size, entry in entries:
+            if total <= max_size:
+                break
+            shutil.rmtree(entry)
+            total -= size
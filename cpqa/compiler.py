@@ -21,6 +21,8 @@
 
 import os, subprocess
 
+from cpqa.shell import remove_file
+
 
 __all__ = ['update_source', 'compile_program']
 
@@ -31,6 +33,7 @@ def update_source(config):
     else:
         print '... Updating to latest version of the source.'
         cvs_outfn = os.path.join(os.path.abspath(config.tstdir), 'cvs.log')
+        remove_file(cvs_outfn)
         f = open(cvs_outfn, 'w')
         p = subprocess.Popen(
             config.cvs_update,
@@ -45,6 +48,7 @@ def update_source(config):
 def compile_program(config):
     print '... Compiling.'
     make_outfn = os.path.join(os.path.abspath(config.tstdir), 'compile.log')
+    remove_file(make_outfn)
     f = open(make_outfn, 'w')
     p = subprocess.Popen(
         config.make,
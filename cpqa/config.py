@@ -19,14 +19,14 @@
 # --
 
 
-import os, imp, datetime, sys, optparse, string
+import os, imp, datetime, sys, optparse, string, time
 
 
 __all__ = ['Config']
 
 
 class Config(object):
-    def __init__(self, args, use_last=False):
+    def __init__(self, args, use_last=False, options=None):
         # Get stuff from the config.py file
         if not os.path.isfile('config.py'):
             raise IOError('Could not find file config.py')
@@ -42,6 +42,15 @@ class Config(object):
         self.nproc = user_config.__dict__.get('nproc', 1)
         self.nproc_mpi = user_config.__dict__.get('nproc_mpi', 1)
         self.mpi_prefix = user_config.__dict__.get('mpi_prefix', None)
+        self.driver_pool = user_config.__dict__.get('driver_pool', False)
+        self.timeout_factor = user_config.__dict__.get('timeout_factor', 10.0)
+        self.timeout_floor = user_config.__dict__.get('timeout_floor', 60.0)
+        self.result_cache_size = user_config.__dict__.get('result_cache_size', None)
+        self.history_window = user_config.__dict__.get('history_window', 10)
+        self.history_threshold = user_config.__dict__.get('history_threshold', 5.0)
+        self.dedup = user_config.__dict__.get('dedup', False)
+        self.compress_outputs = user_config.__dict__.get('compress_outputs', False)
+        self.link_inputs = user_config.__dict__.get('link_inputs', False)
         os.remove('config.pyc')
         # Some type checking on the config.py data
         if not isinstance(self.root, basestring):
@@ -71,7 +80,37 @@ class Config(object):
         if self.mpi_prefix is not None:
             if not isinstance(self.mpi_prefix, basestring):
                 raise TypeError('Error in config.py: mpi_prefix must be a string or None.')
-            self.mpi_prefix = self.mpi_prefix % self.nproc_mpi
+            # The template is kept to format the prefix for jobs with a
+            # different number of MPI processes.
+            self.mpi_template = self.mpi_prefix
+            self.mpi_prefix = self.mpi_template % self.nproc_mpi
+        if not isinstance(self.driver_pool, bool):
+            raise TypeError('Error in config.py: driver_pool must be a boolean.')
+        if self.timeout_factor is not None:
+            if not isinstance(self.timeout_factor, (int, float)):
+                raise TypeError('Error in config.py: timeout_factor must be a number or None.')
+            if self.timeout_factor <= 0:
+                raise ValueError('Error in config.py: timeout_factor must be strictly positive.')
+        if not isinstance(self.timeout_floor, (int, float)):
+            raise TypeError('Error in config.py: timeout_floor must be a number.')
+        if self.result_cache_size is not None:
+            if not isinstance(self.result_cache_size, (int, float)):
+                raise TypeError('Error in config.py: result_cache_size must be a number or None.')
+            if self.result_cache_size <= 0:
+                raise ValueError('Error in config.py: result_cache_size must be strictly positive.')
+        if self.history_window is not None:
+            if not isinstance(self.history_window, int):
+                raise TypeError('Error in config.py: history_window must be an integer or None.')
+            if self.history_window < 5:
+                raise ValueError('Error in config.py: history_window must be at least 5.')
+        if not isinstance(self.history_threshold, (int, float)):
+            raise TypeError('Error in config.py: history_threshold must be a number.')
+        if not isinstance(self.dedup, bool):
+            raise TypeError('Error in config.py: dedup must be a boolean.')
+        if not isinstance(self.compress_outputs, bool):
+            raise TypeError('Error in config.py: compress_outputs must be a boolean.')
+        if not isinstance(self.link_inputs, bool):
+            raise TypeError('Error in config.py: link_inputs must be a boolean.')
         # Some derived config vars and checks
         self.bin = string.Template(self.bin).safe_substitute(root=self.root, arch=self.arch, version=self.version)
         self.testsrc = string.Template(self.testsrc).safe_substitute(root=self.root, arch=self.arch, version=self.version)
@@ -90,16 +129,41 @@ class Config(object):
             self.datetag = datetime.datetime.now().strftime('%Y-%m-%d-%a--%H-%M-%S')
         self.runtag = '%s--%s' % (self.bintag, self.datetag)
         self.refdir = 'ref--%s' % self.bintag
+        self.cachedir = 'cache--%s' % self.bintag
+        self.historyfile = 'cpqa-history.sqlite'
+        self.coveragefile = 'cpqa-coverage.pickle'
+        self.indexfile = 'cpqa-index.pickle'
+        self.objectdir = 'objects'
         self.tstdir = 'tst--%s' % self.runtag
         self.indir = 'in'
         # Store command line args for test selection
         self.args = args
+        # Options from the command line of cpqa-main.py
+        self.stream = getattr(options, 'stream', False)
+        self.abort_on_divergence = getattr(options, 'abort_on_divergence', False)
+        self.divergence_tolerance = getattr(options, 'divergence_tolerance', 1e-6)
+        if self.divergence_tolerance <= 0:
+            raise ValueError('The option --divergence-tolerance must be strictly positive.')
+        self.record_coverage = getattr(options, 'record_coverage', False)
+        self.resume = getattr(options, 'resume', False)
+        self.failed_first = getattr(options, 'failed_first', False)
+        self.exitfirst_on = getattr(options, 'exitfirst_on', None)
+        if self.exitfirst_on is not None and self.exitfirst_on <= 0:
+            raise ValueError('The option --exitfirst-on must be strictly positive.')
+        self.deadline = getattr(options, 'deadline', None)
+        if self.deadline is None:
+            self.deadline_time = None
+        else:
+            self.deadline_time = time.time() + self.deadline
 
     def parse_args(self):
         self.select_dirs = []
         self.select_paths_inp = []
         self.faster_than = None
         self.slower_than = None
+        self.shard = None
+        self.changed = None
+        self.budget = None
         for arg in self.args:
             if os.path.isfile(arg):
                 arg = arg[len(self.indir)+1:]
@@ -117,8 +181,27 @@ class Config(object):
                 if self.faster_than is not None or self.slower_than is not None:
                     raise ValueError('Only one fast:x or slow:x argument is allowed.')
                 self.slower_than = float(arg[5:])
+            elif arg.startswith('shard:'):
+                if self.shard is not None:
+                    raise ValueError('Only one shard:k/n argument is allowed.')
+                words = arg[6:].split('/')
+                if len(words) != 2:
+                    raise ValueError('The shard argument must have the form shard:k/n.')
+                self.shard = (int(words[0]), int(words[1]))
+                if self.shard[1] <= 0 or self.shard[0] <= 0 or self.shard[0] > self.shard[1]:
+                    raise ValueError('The shard argument shard:k/n must satisfy 1 <= k <= n.')
+            elif arg.startswith('changed:'):
+                if self.changed is not None:
+                    raise ValueError('Only one changed:x argument is allowed.')
+                self.changed = arg[8:]
+            elif arg.startswith('budget:'):
+                if self.budget is not None:
+                    raise ValueError('Only one budget:x argument is allowed.')
+                self.budget = float(arg[7:])
+                if self.budget <= 0:
+                    raise ValueError('The budget argument budget:x must be strictly positive.')
             else:
-                raise ValueError('Arguments must be one optional timing restriction, existing directories or input files.')
+                raise ValueError('Arguments must be one optional timing restriction, an optional shard, an optional changed:x, an optional budget:x, existing directories or input files.')
 
     def filter_inputs_name(self, test_inputs):
         result = []
@@ -142,6 +225,37 @@ class Config(object):
             result = test_inputs
         return result
 
+    def get_nproc(self, test_input):
+        '''Return the number of cores used by a test job.
+
+           Without an MPI prefix, each job runs in serial. Otherwise the NPROC
+           directive in the input sets the number of MPI processes, which
+           defaults to nproc_mpi. A job never gets more than nproc processes.
+        '''
+        if self.mpi_prefix is None:
+            return 1
+        if test_input.nproc is None:
+            return min(self.nproc_mpi, self.nproc)
+        return min(test_input.nproc, self.nproc)
+
+    def get_mpi_prefix(self, test_input):
+        '''Return the MPI prefix for a test job, or None'''
+        if self.mpi_prefix is None:
+            return None
+        return self.mpi_template % self.get_nproc(test_input)
+
+    def get_timeout(self, test_input):
+        '''Return the time limit for a test job, or None if there is none.
+
+           A TIMEOUT directive in the input takes precedence. Otherwise the
+           limit is derived from the timing of the reference run.
+        '''
+        if test_input.timeout is not None:
+            return test_input.timeout
+        if self.timeout_factor is None or test_input.ref_result is None:
+            return None
+        return self.timeout_factor*test_input.ref_result.seconds + self.timeout_floor
+
     def filter_inputs_timing(self, test_inputs):
         if self.faster_than is None and self.slower_than is None:
             return test_inputs
@@ -0,0 +1,190 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, struct, subprocess
+
+from cpqa.shell import load_pickle, dump_pickle
+
+
+__all__ = [
+    'read_gcda', 'find_covered', 'get_source_name', 'get_changed_files',
+    'load_coverage', 'save_coverage', 'select_changed',
+]
+
+
+# The tags of the records in a .gcda file.
+GCOV_TAG_FUNCTION = 0x01000000
+GCOV_TAG_ARCS = 0x01a10000
+GCOV_TAG_OBJECT_SUMMARY = 0xa1000000
+GCOV_TAG_PROGRAM_SUMMARY = 0xa3000000
+
+
+def _known_tag(tag):
+    if tag in (GCOV_TAG_FUNCTION, GCOV_TAG_OBJECT_SUMMARY, GCOV_TAG_PROGRAM_SUMMARY):
+        return True
+    # The tags of the different types of counters.
+    return tag & 0xffff == 0 and GCOV_TAG_ARCS <= tag < GCOV_TAG_ARCS + 0x00200000
+
+
+def _walk_gcda(data, endian, header, unit):
+    '''Return the records of a .gcda file for one layout, or None'''
+    records = []
+    pos = header
+    while pos < len(data):
+        if pos + 4 > len(data):
+            return None
+        tag = struct.unpack(endian + 'I', data[pos:pos+4])[0]
+        if tag == 0:
+            # End of file marker.
+            break
+        if not _known_tag(tag):
+            return None
+        if pos + 8 > len(data):
+            return None
+        length = struct.unpack(endian + 'i', data[pos+4:pos+8])[0]
+        pos += 8
+        if length < 0:
+            # A counter record without data, i.e. all counters are zero.
+            records.append((tag, ''))
+            continue
+        size = length*unit
+        if pos + size > len(data):
+            return None
+        records.append((tag, data[pos:pos+size]))
+        pos += size
+    return records
+
+
+def read_gcda(path):
+    '''Return True when some code of the object of a .gcda file was executed.
+
+       The layout of the .gcda files depends on the version of GCC. Older
+       versions have a header of three words and give the length of a record in
+       words. Newer versions add a checksum to the header and give the length
+       in bytes. The first layout with only known records is used. Files that
+       can not be parsed are considered to be covered.
+    '''
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    if data[:4] == 'gcda':
+        endian = '>'
+    elif data[:4] == 'adcg':
+        endian = '<'
+    else:
+        return True
+    for header, unit in (16, 1), (12, 4):
+        records = _walk_gcda(data, endian, header, unit)
+        if records is None:
+            continue
+        for tag, payload in records:
+            if tag == GCOV_TAG_ARCS and payload.strip('\x00') != '':
+                return True
+        return False
+    return True
+
+
+def get_source_name(path):
+    '''Return the name of a source file without directory and extension
+
+       The .gcda files of the objects are matched with the changed source files
+       based on this name.
+    '''
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def find_covered(dirname):
+    '''Return the sorted names of the sources that were executed
+
+       *Arguments:*
+
+       dirname
+            The directory that was used as GCOV_PREFIX for a test job.
+    '''
+    result = set([])
+    for root, dirnames, filenames in os.walk(dirname):
+        for filename in filenames:
+            if filename.endswith('.gcda') and read_gcda(os.path.join(root, filename)):
+                result.add(get_source_name(filename))
+    return sorted(result)
+
+
+def get_changed_files(root, spec):
+    '''Return the changed source files for a changed:... argument
+
+       *Arguments:*
+
+       root
+            The directory with the CP2K source code.
+
+       spec
+            A git range (with two dots), or a comma-separated list of files.
+    '''
+    if '..' in spec:
+        p = subprocess.Popen(
+            ['git', 'diff', '--name-only', spec], cwd=root,
+            stdout=subprocess.PIPE
+        )
+        lines = p.stdout.readlines()
+        p.stdout.close()
+        if p.wait() != 0:
+            raise ValueError('Could not get the changed files of the git range %s.' % spec)
+        return [line.strip() for line in lines if len(line.strip()) > 0]
+    return [word for word in spec.split(',') if len(word) > 0]
+
+
+def load_coverage(path):
+    '''Return a dictionary with the covered sources of each input path'''
+    coverage = load_pickle(path)
+    if coverage is None:
+        return {}
+    return coverage
+
+
+def save_coverage(path, coverage):
+    dump_pickle(path, coverage)
+
+
+def select_changed(test_inputs, coverage, changed_files):
+    '''Return the test inputs that are affected by the changed files
+
+       Tests that are not in the coverage map are always selected, because
+       their coverage is not known.
+
+       Returns a tuple with the selected test inputs and the changed files
+       that are not a source in the coverage map. When there are such files,
+       e.g. included files or a Makefile, all test inputs are selected, because
+       the affected tests can not be derived from the coverage.
+    '''
+    known = set([])
+    for names in coverage.itervalues():
+        known.update(names)
+    unknown_files = [
+        path for path in changed_files if get_source_name(path) not in known
+    ]
+    if len(unknown_files) > 0:
+        return list(test_inputs), unknown_files
+    names = set(get_source_name(path) for path in changed_files)
+    return [
+        test_input for test_input in test_inputs
+        if test_input.path_inp not in coverage or
+        len(names & set(coverage[test_input.path_inp])) > 0
+    ], unknown_files
@@ -27,8 +27,34 @@ from cpqa.tests import test_factories
 __all__ = ['TestInput', 'TestResult']
 
 
+def isfile_listed(path, listings):
+    '''Same as os.path.isfile, but only stats files that are present in the
+       (cached) listing of their directory.
+
+       *Arguments:*
+
+       path
+            The path to be checked.
+
+       listings
+            A dictionary with the names in each directory, which is extended
+            when a new directory is encountered.
+    '''
+    head, tail = os.path.split(path)
+    if len(tail) == 0:
+        return False
+    names = listings.get(head)
+    if names is None:
+        try:
+            names = set(os.listdir(head or '.'))
+        except OSError:
+            names = set([])
+        listings[head] = names
+    return tail in names and os.path.isfile(path)
+
+
 class TestInput(object):
-    def __init__(self, root, path_inp):
+    def __init__(self, root, path_inp, listings=None):
         '''
            *Arguments:*
 
@@ -37,14 +63,27 @@ class TestInput(object):
 
            path_inp
                 The path to the test input relative to the root directory.
+
+           *Optional arguments:*
+
+           listings
+                A dictionary with directory listings that is shared by several
+                test inputs. See isfile_listed.
         '''
+        if listings is None:
+            listings = {}
         self.root = root
         self.path_inp = path_inp
         self.active = False
         self.num_resets = 0
+        self.timeout = None
+        self.nproc = None
         self.tests = []
         self.depends = []
         self.paths_extra = []
+        # The directories that were searched for extra files, relative to the
+        # root directory.
+        self.dirs_searched = set([])
         # related to input path
         if path_inp.endswith('.inp'):
             pre = path_inp[:-4]
@@ -56,6 +95,8 @@ class TestInput(object):
         self.path_out = pre + '.out'
         self.path_stdout = pre + '.stdout'
         self.path_stderr = pre + '.stderr'
+        self.path_refcache = pre + '.refcache'
+        self.path_coverage = pre + '.coverage'
 
         dirname = os.path.join(os.path.dirname(path_inp))
         f = open(os.path.join(root, path_inp))
@@ -70,6 +111,10 @@ class TestInput(object):
                     words = shlex.split(line)
                     key = words[0].lower()
                     self.tests.append(test_factories[key](words[1:]))
+                elif line.startswith('NPROC '):
+                    self.nproc = max(1, int(line[6:]))
+                elif line.startswith('TIMEOUT '):
+                    self.timeout = float(line[8:])
                 elif line.startswith('DEPENDS '):
                     fn_depends = line[8:].strip()
                     path_depends = os.path.join(dirname, fn_depends)
@@ -90,7 +135,10 @@ class TestInput(object):
                     if (fn_extra[0] == '"' and fn_extra[-1] == '"') or \
                        (fn_extra[0] == "'" and fn_extra[-1] == "'"):
                         fn_extra = fn_extra[1:-1]
-                    if os.path.isfile(os.path.join(root, dirname, fn_extra)):
+                    self.dirs_searched.add(os.path.normpath(
+                        os.path.join(dirname, os.path.dirname(fn_extra))
+                    ))
+                    if isfile_listed(os.path.join(root, dirname, fn_extra), listings):
                         # Make sure none of the data has any traces of the 'in',
                         # 'ref-*' or 'tst-*' directory.
                         path_extra = os.path.join(dirname, fn_extra)
@@ -107,7 +155,8 @@ class TestInput(object):
 
 class TestResult(object):
     def __init__(self, path_inp, flags, seconds_bin, seconds, tests,
-                 messages, last_out_lines, last_stdout_lines, last_stderr_lines):
+                 messages, last_out_lines, last_stdout_lines, last_stderr_lines,
+                 timeout=None):
         self.path_inp = path_inp
         self.flags = flags
         self.seconds_bin = seconds_bin
@@ -117,5 +166,6 @@ class TestResult(object):
         self.last_out_lines = last_out_lines
         self.last_stdout_lines = last_stdout_lines
         self.last_stderr_lines = last_stderr_lines
+        self.timeout = timeout
         # derived
         self.seconds_script = seconds - seconds_bin
@@ -0,0 +1,240 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, re, sre_parse, sre_constants
+
+
+__all__ = ['get_literal', 'combine_regexes', 'Harvester', 'OutputFollower']
+
+
+def _parse(regex):
+    try:
+        return sre_parse.parse(regex)
+    except (sre_constants.error, AssertionError, OverflowError):
+        return None
+
+
+def get_literal(regex):
+    '''Return the longest string that is part of every match of the regex.
+
+       An empty string is returned when no such string can be found cheaply.
+    '''
+    parsed = _parse(regex)
+    if parsed is None or parsed.pattern.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return ''
+    best = ''
+    current = ''
+    for op, av in parsed:
+        if op == sre_constants.LITERAL and av < 256:
+            current += chr(av)
+            if len(current) > len(best):
+                best = current
+        else:
+            current = ''
+    return best
+
+
+def _walk(parsed):
+    # Iterate over all operations of a parsed regex, including the nested ones.
+    todo = [parsed]
+    while len(todo) > 0:
+        for op, av in todo.pop():
+            yield op, av
+            if isinstance(av, sre_parse.SubPattern):
+                todo.append(av)
+            elif isinstance(av, (tuple, list)):
+                for item in av:
+                    if isinstance(item, sre_parse.SubPattern):
+                        todo.append(item)
+                    elif isinstance(item, list):
+                        todo.extend(sub for sub in item if isinstance(sub, sre_parse.SubPattern))
+
+
+def _combinable(regex):
+    # Flags and back references would change meaning in a combined regex. The
+    # beginning and end of the string have a different meaning when the regex
+    # is applied to a complete file instead of a single line.
+    parsed = _parse(regex)
+    if parsed is None or parsed.pattern.flags != 0:
+        return False
+    for op, av in _walk(parsed):
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return False
+        if op == sre_constants.AT and av in (sre_constants.AT_BEGINNING_STRING,
+                                             sre_constants.AT_END_STRING):
+            return False
+    return True
+
+
+def _line_local(regex):
+    '''Return True when a match in a line is also a match in the whole file.
+
+       When a regex is searched in a complete file, the text around a line is
+       visible too. A negative lookahead or a lookbehind may then fail where it
+       succeeds for the line alone. The same holds for an end of line or a word
+       boundary after a newline, e.g. in the regex '\\s$'.
+    '''
+    parsed = _parse(regex)
+    if parsed is None:
+        return False
+    newline = False
+    edge = False
+    for op, av in _walk(parsed):
+        if op == sre_constants.ASSERT_NOT or (op == sre_constants.ASSERT and av[0] < 0):
+            return False
+        if op in (sre_constants.IN, sre_constants.NOT_LITERAL) or \
+           (op == sre_constants.LITERAL and av == ord('\n')):
+            newline = True
+        if op == sre_constants.AT and av in (sre_constants.AT_END,
+                                             sre_constants.AT_BOUNDARY,
+                                             sre_constants.AT_NON_BOUNDARY):
+            edge = True
+    return not (newline and edge)
+
+
+def combine_regexes(regexes, flags=0):
+    '''Compile one regex that matches when one of the given regexes matches.
+
+       Returns None when the regexes can not be combined safely.
+    '''
+    if len(regexes) == 0:
+        return None
+    for regex in regexes:
+        if not _combinable(regex):
+            return None
+    try:
+        return re.compile('|'.join('(?:%s)' % regex for regex in regexes), flags)
+    except (re.error, AssertionError, OverflowError):
+        return None
+
+
+class Harvester(object):
+    '''Feeds the lines of an output file to a set of fragments in one pass.
+
+       The regexes of the fragments are combined into one regex. Lines that do
+       not match the combined regex are skipped, unless some fragment is
+       collecting a block of lines. The other lines are only fed to the
+       fragments whose literal prefilter is part of the line. Regexes that can
+       not be combined safely are only checked with their literal prefilter.
+
+       The result is the same as feeding every line to every fragment.
+
+       The method harvest scans an OutputFile with the combined regex, such that
+       only the lines of interest are converted into strings. This is only done
+       when a match of each regex in a line is also a match in the whole file.
+       Otherwise, all lines are fed one by one.
+    '''
+    def __init__(self, fragments):
+        self.fragments = fragments
+        regexes = []
+        self.dispatch = []
+        self.loose = []
+        for fragment in fragments:
+            fragment_regexes = fragment.get_regexes()
+            literals = [get_literal(regex) for regex in fragment_regexes]
+            self.dispatch.append((fragment, literals))
+            if all(_combinable(regex) for regex in fragment_regexes):
+                regexes.extend(fragment_regexes)
+            else:
+                self.loose.append((fragment, literals))
+        self.combined = combine_regexes(regexes)
+        if all(_line_local(regex) for regex in regexes):
+            self.combined_multiline = combine_regexes(regexes, re.MULTILINE)
+        else:
+            self.combined_multiline = None
+        if self.combined is None:
+            self.loose = self.dispatch
+        self.active = [fragment for fragment in fragments if fragment.active]
+
+    def _feed(self, line, dispatch):
+        for fragment, literals in dispatch:
+            if fragment.active:
+                fragment.feed(line)
+                continue
+            for literal in literals:
+                if literal in line:
+                    fragment.feed(line)
+                    break
+        self.active = [fragment for fragment in self.fragments if fragment.active]
+
+    def feed(self, line):
+        if len(self.active) == 0 and (self.combined is None or
+           self.combined.search(line) is None):
+            if len(self.loose) > 0:
+                self._feed(line, self.loose)
+        else:
+            self._feed(line, self.dispatch)
+
+    def harvest(self, output):
+        '''Feed the relevant lines of an OutputFile to the fragments'''
+        if len(self.fragments) == 0:
+            return
+        if len(self.loose) > 0 or self.combined_multiline is None:
+            for line in output.iter_lines():
+                self.feed(line)
+            return
+        data = output.data
+        pos = 0
+        while pos < output.size:
+            if len(self.active) == 0:
+                # Jump to the line with the next match. In the multiline mode,
+                # the combined regex may match some text that is not matched
+                # when the lines are fed one by one, e.g. across lines. The
+                # opposite is excluded by _line_local. The fragments check the
+                # line anyway.
+                match = self.combined_multiline.search(data, pos)
+                if match is None:
+                    break
+                pos = output.get_line_start(match.start())
+            line, pos = output.get_line(pos)
+            self._feed(line, self.dispatch)
+
+
+class OutputFollower(object):
+    '''Feeds the lines of a growing output file to a harvester.
+
+       The method update must be called regularly while the output is written.
+       The last call must have the argument final=True.
+    '''
+    def __init__(self, path, harvester):
+        self.path = path
+        self.harvester = harvester
+        self.f = None
+        self.pos = 0
+        self.partial = ''
+
+    def update(self, final=False):
+        if self.f is None:
+            if not os.path.isfile(self.path):
+                return
+            self.f = open(self.path, 'rb')
+        self.f.seek(self.pos)
+        data = self.f.read()
+        self.pos += len(data)
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.harvester.feed(line + '\n')
+        if final:
+            if len(self.partial) > 0:
+                self.harvester.feed(self.partial)
+                self.partial = ''
+            self.f.close()
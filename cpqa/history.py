@@ -0,0 +1,134 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+
+__all__ = ['TimingHistory', 'open_history', 'median', 'find_timing_regressions']
+
+
+class TimingHistory(object):
+    '''An SQLite database with the timings of the tests in all test runs.
+
+       The timings are keyed by the binary tag (arch and version), the date tag
+       of the run and the input path.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS timings (
+                bintag TEXT, datetag TEXT, path_inp TEXT, seconds_bin REAL,
+                seconds_script REAL, PRIMARY KEY (bintag, path_inp, datetag));
+        ''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, bintag, datetag, records):
+        '''Add the timings of a run
+
+           *Arguments:*
+
+           bintag, datetag
+                The tags of the test run.
+
+           records
+                A list of (path_inp, seconds_bin, seconds_script) tuples.
+        '''
+        self.connection.executemany('INSERT OR REPLACE INTO timings VALUES (?, ?, ?, ?, ?)', [
+            (bintag, datetag, path_inp, seconds_bin, seconds_script)
+            for path_inp, seconds_bin, seconds_script in records
+        ])
+        self.connection.commit()
+
+    def get_previous(self, bintag, datetag, path_inp, window):
+        '''Return the binary timings of a test in the last runs before datetag'''
+        return [row[0] for row in self.connection.execute(
+            'SELECT seconds_bin FROM timings WHERE bintag=? AND path_inp=? AND '
+            'datetag<? ORDER BY datetag DESC LIMIT ?',
+            (bintag, path_inp, datetag, window)
+        )]
+
+
+def open_history(path):
+    '''Return a TimingHistory, or None if SQLite is not available'''
+    if sqlite3 is None:
+        return None
+    try:
+        return TimingHistory(path)
+    except sqlite3.Error:
+        return None
+
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    if n % 2 == 1:
+        return values[n/2]
+    else:
+        return 0.5*(values[n/2-1] + values[n/2])
+
+
+def find_timing_regressions(history, config, test_inputs):
+    '''Compare the binary timings of a run with those of the previous runs.
+
+       The baseline of a test is the median of its timings in the last
+       config.history_window runs. The spread is estimated by the median
+       absolute deviation (MAD), scaled to be consistent with the standard
+       deviation of a normal distribution. Single outliers in the previous runs
+       do not affect these estimates.
+
+       A test has a timing regression when its timing exceeds the median by
+       more than config.history_threshold times the spread and by more than
+       one second. The spread is at least 5% of the median, such that tests
+       with very reproducible timings are not reported for tiny changes. At
+       least five previous timings are needed.
+
+       Returns a list of (test_input, seconds_bin, median, spread) tuples.
+    '''
+    result = []
+    for test_input in test_inputs:
+        tst_result = test_input.tst_result
+        if tst_result is None or not is_timed(tst_result):
+            continue
+        previous = history.get_previous(
+            config.bintag, config.datetag, test_input.path_inp, config.history_window
+        )
+        if len(previous) < 5:
+            continue
+        baseline = median(previous)
+        spread = max(1.4826*median([abs(value - baseline) for value in previous]), 0.05*baseline)
+        excess = tst_result.seconds_bin - baseline
+        if excess > config.history_threshold*spread and excess > 1.0:
+            result.append((test_input, tst_result.seconds_bin, baseline, spread))
+    return result
+
+
+def is_timed(result):
+    '''Return True when the timings of a result are meaningful for the history'''
+    flags = result.flags
+    return not (flags.get('cached') or flags['failed'] or flags.get('aborted') or
+                flags.get('timeout') or flags.get('skipped'))
@@ -23,6 +23,8 @@ import os, shutil
 from optparse import OptionParser
 
 from cpqa.data import TestInput
+from cpqa.shell import checksum, load_pickle, dump_pickle, parallel_map, \
+    copy_file
 
 
 __all__ = ['import_main']
@@ -94,58 +96,190 @@ def import_main(config):
                 l.append(comments)
         f.close()
 
-    # Remove old test input directory
-    if os.path.exists(config.indir):
-        shutil.rmtree(config.indir)
+    # Load the manifest of the previous import. Without a manifest, the input
+    # directory is rebuilt from scratch.
+    path_manifest = os.path.join(config.indir, 'cpqa.manifest')
+    # A broken manifest also results in a complete import.
+    manifest = load_pickle(path_manifest)
+    if manifest is None:
+        if os.path.exists(config.indir):
+            shutil.rmtree(config.indir)
+        manifest = {'inputs': {}, 'extras': {}}
+    new_manifest = {'inputs': {}, 'extras': {}}
 
-    # Load inputs and transform them
+    # Load inputs and transform them, unless the source and the directives are
+    # unchanged since the previous import. The inputs are processed by a pool
+    # of processes, in groups of inputs in the same directory.
+    groups = {}
+    for test_dir, test_input, test_index in test_inputs:
+        path_inp = os.path.join(test_dir, test_input)
+        if test_index >= 0:
+            test_type = test_types[test_index]
+        else:
+            test_type = None
+        resets = tuple(reset_info.get(path_inp, []))
+        old = manifest['inputs'].get(path_inp)
+        group = groups.get(test_dir)
+        if group is None:
+            group = (config.testsrc, config.indir, [])
+            groups[test_dir] = group
+            # Create the directories in advance, such that the processes do
+            # not have to compete for it.
+            dst_test_dir = os.path.join(config.indir, test_dir)
+            if not os.path.isdir(dst_test_dir):
+                os.makedirs(dst_test_dir)
+        group[2].append((path_inp, test_type, resets, old))
+    results = {}
+    for group_results in parallel_map(import_inputs, groups.values(), config.nproc):
+        results.update(group_results)
     paths_extra = set([])
+    converted = set([])
     for test_dir, test_input, test_index in test_inputs:
-        src_test_dir = os.path.join(config.testsrc, test_dir)
-        dst_test_dir = os.path.join(config.indir, test_dir)
-        if not os.path.isdir(dst_test_dir):
-            os.makedirs(dst_test_dir)
-        f_src = file(os.path.join(src_test_dir, test_input), 'r')
-        f_dst = file(os.path.join(dst_test_dir, test_input), 'w')
-        if not is_converted(f_src):
-            # Mark converted inputs.
-            print >> f_dst, '#CPQA CONVERTED'
-            # More serious directives
-            if test_index >= 0:
-                regex, column = test_types[test_index].split('!')
-                # escape _some_ special characters that are to be taken literally
-                regex = regex.replace('|', '\|').replace('(', '\(').replace(')', '\)')
-                regex = regex.replace('+', '\+')
-                print >> f_dst, '#CPQA TEST SCALAR \'%s\' %i' % (
-                   regex, int(column) - 1
-                )
-            resets = reset_info.get(os.path.join(test_dir, test_input), [])
-            for reset in resets:
-                print >> f_dst, '#CPQA RESET', reset[0]
-                for line in reset[1:]:
-                    print >> f_dst, '#          ', line
-        # Copy of the actual test input
-        for line in f_src:
-            print >> f_dst, line[:-1]
-        f_src.close()
-        f_dst.close()
-        # Get the extra paths
-        test_input = TestInput(os.path.join(config.testsrc), os.path.join(test_dir, test_input))
-        for path_extra in test_input.paths_extra:
+        path_inp = os.path.join(test_dir, test_input)
+        result = results[path_inp]
+        # Report the same error as in a serial import.
+        if isinstance(result, Exception):
+            raise result
+        if result['converted']:
+            converted.add(path_inp)
+        del result['converted']
+        new_manifest['inputs'][path_inp] = result
+        for path_extra in result['paths_extra']:
             paths_extra.add(path_extra)
 
-    # Copy extra files needed by the inputs
-    for path_extra in paths_extra:
+    # Copy extra files needed by the inputs, unless they are unchanged.
+    todo = []
+    for path_extra in sorted(paths_extra):
         extra_dir = os.path.dirname(path_extra)
         src_path_extra = os.path.join(config.testsrc, path_extra)
         dst_path_extra = os.path.join(config.indir, path_extra)
         dst_extra_dir = os.path.join(config.indir, extra_dir)
+        stat = get_tree_stat(src_path_extra)
+        new_manifest['extras'][path_extra] = stat
+        # An extra file that is also an input was just overwritten by the
+        # converted input.
+        if manifest['extras'].get(path_extra) == stat and \
+           path_extra not in converted and os.path.exists(dst_path_extra):
+            continue
         if not os.path.isdir(dst_extra_dir):
             os.makedirs(dst_extra_dir)
-        if os.path.isfile(src_path_extra):
-            shutil.copy(src_path_extra, dst_extra_dir)
-        else:
-            shutil.copytree(src_path_extra, dst_path_extra)
+        todo.append((src_path_extra, dst_path_extra))
+    parallel_map(copy_extra, todo, config.nproc)
+
+    # Remove inputs and extra files that are no longer used.
+    for path in set(manifest['inputs']) | set(manifest['extras']):
+        if path in new_manifest['inputs'] or path in new_manifest['extras']:
+            continue
+        dst_path = os.path.join(config.indir, path)
+        if os.path.isdir(dst_path):
+            shutil.rmtree(dst_path)
+        elif os.path.isfile(dst_path):
+            os.remove(dst_path)
+
+    print '... Converted inputs: %i' % len(converted)
+    if not os.path.isdir(config.indir):
+        os.makedirs(config.indir)
+    dump_pickle(path_manifest, new_manifest)
+
+
+def import_inputs(group):
+    '''Convert a group of inputs in the same directory, if needed.
+
+       Returns a dictionary with the manifest entry of each input, or the
+       exception raised for that input.
+    '''
+    testsrc, indir, jobs = group
+    # Directory listings to detect the extra files of the inputs.
+    listings = {}
+    results = {}
+    for path_inp, test_type, resets, old in jobs:
+        try:
+            results[path_inp] = import_input(testsrc, indir, path_inp, test_type, resets, old, listings)
+        except Exception, e:
+            results[path_inp] = e
+    return results
+
+
+def import_input(testsrc, indir, path_inp, test_type, resets, old, listings):
+    src_path_inp = os.path.join(testsrc, path_inp)
+    dst_path_inp = os.path.join(indir, path_inp)
+    stat = get_stat(src_path_inp)
+    if old is not None and old['stat'] == stat:
+        src_checksum = old['checksum']
+    else:
+        src_checksum = checksum(src_path_inp)
+    if old is not None and old['checksum'] == src_checksum and \
+       old['test_type'] == test_type and old['resets'] == resets and \
+       os.path.isfile(dst_path_inp):
+        converted = False
+    else:
+        convert_input(src_path_inp, dst_path_inp, test_type, resets)
+        converted = True
+    # Get the extra paths. They are also detected for unchanged inputs, because
+    # a file mentioned in the input may have been added to the source tree.
+    paths_extra = TestInput(testsrc, path_inp, listings).paths_extra
+    return {
+        'stat': stat, 'checksum': src_checksum, 'test_type': test_type,
+        'resets': resets, 'paths_extra': paths_extra, 'converted': converted,
+    }
+
+
+def convert_input(src_path_inp, dst_path_inp, test_type, resets):
+    f_src = file(src_path_inp, 'r')
+    # The old input is removed first instead of being overwritten, because it
+    # may be hard linked into test directories.
+    if os.path.isfile(dst_path_inp):
+        os.remove(dst_path_inp)
+    f_dst = file(dst_path_inp, 'w')
+    if not is_converted(f_src):
+        # Mark converted inputs.
+        print >> f_dst, '#CPQA CONVERTED'
+        # More serious directives
+        if test_type is not None:
+            regex, column = test_type.split('!')
+            # escape _some_ special characters that are to be taken literally
+            regex = regex.replace('|', '\|').replace('(', '\(').replace(')', '\)')
+            regex = regex.replace('+', '\+')
+            print >> f_dst, '#CPQA TEST SCALAR \'%s\' %i' % (
+               regex, int(column) - 1
+            )
+        for reset in resets:
+            print >> f_dst, '#CPQA RESET', reset[0]
+            for line in reset[1:]:
+                print >> f_dst, '#          ', line
+    # Copy of the actual test input
+    for line in f_src:
+        print >> f_dst, line[:-1]
+    f_src.close()
+    f_dst.close()
+
+
+def copy_extra(paths):
+    src_path_extra, dst_path_extra = paths
+    if os.path.isfile(src_path_extra):
+        copy_file(src_path_extra, os.path.dirname(dst_path_extra))
+    else:
+        if os.path.isdir(dst_path_extra):
+            shutil.rmtree(dst_path_extra)
+        shutil.copytree(src_path_extra, dst_path_extra)
+
+
+def get_stat(path):
+    s = os.stat(path)
+    return (s.st_size, s.st_mtime)
+
+
+def get_tree_stat(path):
+    '''Return the sizes and modification times of a file or a directory tree'''
+    if not os.path.isdir(path):
+        return get_stat(path)
+    result = []
+    for root, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            path_fn = os.path.join(root, fn)
+            result.append((path_fn[len(path)+1:], get_stat(path_fn)))
+    return tuple(result)
 
 
 def is_converted(f):
@@ -0,0 +1,121 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, subprocess, select
+
+
+__all__ = ['DriverProcesses', 'DriverPool']
+
+
+class DriverProcesses(object):
+    '''Launches a new cpqa-driver.py process for each job.'''
+    def __init__(self, tstdir):
+        self.tstdir = tstdir
+        self.running = {}
+
+    def __len__(self):
+        return len(self.running)
+
+    def launch(self, test_input, args):
+        p = subprocess.Popen(['cpqa-driver.py'] + args, cwd=self.tstdir, stdout=subprocess.PIPE)
+        self.running[p.pid] = (p, test_input)
+
+    def wait(self):
+        '''Wait for a job to finish.
+
+           Returns the test input, the exit status of the driver and the lines
+           of standard output of the driver.
+        '''
+        while True:
+            pid, retcode = os.wait()
+            if pid in self.running:
+                break
+        p, test_input = self.running.pop(pid)
+        lines = p.stdout.readlines()
+        p.stdout.close()
+        return test_input, retcode, lines
+
+    def close(self):
+        pass
+
+
+class DriverPool(object):
+    '''Sends jobs to long-lived cpqa-driver.py processes in worker mode.
+
+       This avoids the startup of a Python interpreter and the import of the
+       cpqa package for each job. A new worker is only started when all
+       existing workers are busy, so the number of workers never exceeds the
+       number of jobs that run simultaneously.
+    '''
+    def __init__(self, tstdir):
+        self.tstdir = tstdir
+        self.idle = []
+        self.running = {}
+
+    def __len__(self):
+        return len(self.running)
+
+    def launch(self, test_input, args):
+        if len(self.idle) > 0:
+            worker = self.idle.pop()
+        else:
+            worker = subprocess.Popen(
+                ['cpqa-driver.py', '--worker'], cwd=self.tstdir,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True,
+            )
+        worker.stdin.write('\t'.join(args) + '\n')
+        worker.stdin.flush()
+        self.running[worker.stdout.fileno()] = [worker, test_input, '']
+
+    def wait(self):
+        '''Wait for a job to finish.
+
+           Returns the test input, the exit code of the job in the worker and
+           the lines of standard output of the job.
+        '''
+        while True:
+            fds = select.select(self.running.keys(), [], [])[0]
+            for fd in fds:
+                data = os.read(fd, 4096)
+                record = self.running[fd]
+                if len(data) == 0:
+                    # The worker died in the middle of a job.
+                    worker, test_input, output = self.running.pop(fd)
+                    worker.stdin.close()
+                    worker.stdout.close()
+                    retcode = worker.wait()
+                    if retcode == 0:
+                        retcode = 1
+                    return test_input, retcode, output.splitlines(True)
+                record[2] += data
+                lines = record[2].splitlines(True)
+                last = lines[-1]
+                if last.startswith('CPQA-DONE ') and last.endswith('\n'):
+                    worker, test_input, output = self.running.pop(fd)
+                    self.idle.append(worker)
+                    return test_input, int(last[10:]), lines[:-1]
+
+    def close(self):
+        for worker in self.idle:
+            worker.stdin.close()
+            worker.stdout.close()
+            worker.wait()
+        self.idle = []
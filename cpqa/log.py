@@ -21,6 +21,9 @@
 
 import os, difflib
 
+from cpqa.output import OutputFile, find_output
+from cpqa.shell import remove_file
+
 
 __all__ = ['log_txt', 'log_html', 'diff_txt', 'diff_html']
 
@@ -28,7 +31,9 @@ __all__ = ['log_txt', 'log_html', 'diff_txt', 'diff_html']
 def log_txt(runner, timer, f=None):
     config = runner.config
     if f is None:
-        f = open(os.path.join(config.tstdir, 'cpqa.log'), 'w')
+        fn_log = os.path.join(config.tstdir, 'cpqa.log')
+        remove_file(fn_log)
+        f = open(fn_log, 'w')
         print '... Writing text log:', f.name
         do_close = True
     else:
@@ -85,8 +90,23 @@ def log_txt(runner, timer, f=None):
                     print >> f, line
             if result.flags['leak']:
                 print >> f, ' * Some memory leaks were detect. Check the stderr.'
+            if result.flags.get('aborted'):
+                print >> f, ' * Test run was aborted because a value diverged from the reference.'
+            if result.flags.get('timeout'):
+                print >> f, ' * Test run was killed after the time limit of %.1f seconds.' % result.timeout
+            if result.flags.get('skipped'):
+                print >> f, ' * Test was skipped. %s' % ' '.join(result.messages)
             print >> f, '~'*80
 
+    # Timing regressions
+    if len(runner.timing_regressions) > 0:
+        print >> f, '~'*80
+        print >> f, 'Timing regressions compared to the previous runs'
+        print >> f, '    Binary [s]  Median [s]  Spread [s]  Test'
+        for test_input, seconds, baseline, spread in runner.timing_regressions:
+            print >> f, '    %10.2f  %10.2f  %10.2f  %s' % (seconds, baseline, spread, test_input.path_inp)
+        print >> f, '~'*80
+
     # Short summary
     counters = {}
     for test_input in runner.test_inputs:
@@ -123,7 +143,9 @@ p.cat { color: #800; }
 
 def log_html(runner, timer):
     config = runner.config
-    f = open(os.path.join(config.tstdir, 'index.html'), 'w')
+    fn_html = os.path.join(config.tstdir, 'index.html')
+    remove_file(fn_html)
+    f = open(fn_html, 'w')
     print '... Writing html log:', f.name
     print >> f, '<html><head>'
     print >> f, '<title>CPQA log</title>'
@@ -150,6 +172,8 @@ def log_html(runner, timer):
         print >> f, '<tr><th>Faster than</th><td>%.2fs</td></tr>' % config.faster_than
     if config.slower_than is not None:
         print >> f, '<tr><th>Slower than</th><td>%.2fs</td></tr>' % config.slower_than
+    if config.shard is not None:
+        print >> f, '<tr><th>Shard</th><td>%i/%i</td></tr>' % config.shard
     print >> f, '<tr><th>Number of test jobs</th><td>%i</td></tr>' % len(runner.test_inputs)
     print >> f, '<tr><th>Total wall time [s]</th><td>%.2f</td></tr>' % timer.seconds
     print >> f, '</table>'
@@ -173,6 +197,17 @@ def log_html(runner, timer):
     print >> f, '<tr><td>&nbsp;</td><td>%10s</td><td>%i</td></tr>' % ('TOTAL', len(runner.test_inputs))
     print >> f, '</table>'
 
+    if len(runner.timing_regressions) > 0:
+        print >> f, '<h2>Timing regressions</h2>'
+        print >> f, '<p>Binary timings compared to the median of the previous runs.</p>'
+        print >> f, '<table>'
+        print >> f, '<tr><th>Test</th><th>Binary [s]</th><th>Median [s]</th><th>Spread [s]</th></tr>'
+        for test_input, seconds, baseline, spread in runner.timing_regressions:
+            print >> f, '<tr><td>%s</td><td class="red">%.2f</td><td>%.2f</td><td>%.2f</td></tr>' % (
+                test_input.path_inp, seconds, baseline, spread
+            )
+        print >> f, '</table>'
+
     print >> f, '<h2>Regressions</h2>'
     for test_input in runner.test_inputs:
         result = test_input.tst_result
@@ -180,7 +215,9 @@ def log_html(runner, timer):
             continue
         if not result.flags['ok']:
             print >> f, '<h3>%s</h3>' % test_input.path_inp
-            print >> f, '<p><a href=\'%s\'>%s</a></p>' % (test_input.path_out, test_input.path_out)
+            if not result.flags.get('skipped'):
+                fn_out = find_output(os.path.join(config.tstdir, test_input.path_out))[len(config.tstdir)+1:]
+                print >> f, '<p><a href=\'%s\'>%s</a></p>' % (fn_out, fn_out)
             if result.flags['error']:
                 print >> f, '<p class="cat">Something went wrong in the CPQA driver script.</p>'
                 print >> f, '<ol>'
@@ -232,6 +269,12 @@ def log_html(runner, timer):
                 print >> f, '</pre>'
             if result.flags['leak']:
                 print >> f, '<p class="cat">Some memory leaks were detect. Check the stderr.</p>'
+            if result.flags.get('aborted'):
+                print >> f, '<p class="cat">Test run was aborted because a value diverged from the reference.</p>'
+            if result.flags.get('timeout'):
+                print >> f, '<p class="cat">Test run was killed after the time limit of %.1f seconds.</p>' % result.timeout
+            if result.flags.get('skipped'):
+                print >> f, '<p class="cat">Test was skipped. %s</p>' % ' '.join(result.messages)
 
     print >> f, '</body></html>'
     f.close()
@@ -281,14 +324,16 @@ def diff_html(f, old, new, oldname, newname):
 
 
 def diff_html_file(config, test_input):
-    f_ref = open(os.path.join(config.refdir, test_input.path_out))
-    ref_lines = f_ref.readlines()
-    f_ref.close()
-    f_tst = open(os.path.join(config.tstdir, test_input.path_out))
-    tst_lines = f_tst.readlines()
-    f_tst.close()
+    output_ref = OutputFile(os.path.join(config.refdir, test_input.path_out))
+    ref_lines = output_ref.readlines()
+    output_ref.close()
+    output_tst = OutputFile(os.path.join(config.tstdir, test_input.path_out))
+    tst_lines = output_tst.readlines()
+    output_tst.close()
 
-    f_html = open(os.path.join(config.tstdir, test_input.path_out + '.diff.html'), 'w')
+    fn_html = os.path.join(config.tstdir, test_input.path_out + '.diff.html')
+    remove_file(fn_html)
+    f_html = open(fn_html, 'w')
     print '... Writing html log:', f_html.name
     print >> f_html, '<html><head>'
     print >> f_html, '<title>Diff for %s</title>' % test_input.path_out
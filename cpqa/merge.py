@@ -0,0 +1,149 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, shutil
+
+from cpqa.output import find_output
+from cpqa.shell import du, copy_file, remove_file
+from cpqa.store import load_results
+from cpqa.timer import Timer
+from cpqa.work import find_inputs
+
+
+__all__ = ['MergedRun']
+
+
+class MergedRun(object):
+    '''The combined results of several test runs, e.g. the shards of a suite.
+
+       The test directories are merged into the (new) test directory of the
+       config. The attributes are the same as those of a Runner that are used
+       by log_txt and log_html. The attribute timer can be passed to these
+       functions.
+    '''
+    # Files in the test directory that are written for the run as a whole.
+    run_files = set([
+        'cpqa.log', 'index.html', 'cpqa.sqlite', 'cpqa.sqlite-wal',
+        'cpqa.sqlite-shm'
+    ])
+
+    def __init__(self, config, tstdirs):
+        self.config = config
+        print '... Merging test directories.'
+        if os.path.isdir(config.tstdir):
+            raise IOError('Test directory "%s" is already present.' % config.tstdir)
+        os.mkdir(config.tstdir)
+        for tstdir in tstdirs:
+            self.merge_dir(tstdir)
+        # Keep a link to the last test directory.
+        if os.path.islink(config.lastlink):
+            os.remove(config.lastlink)
+        if not os.path.isfile(config.lastlink):
+            os.symlink(config.tstdir, config.lastlink)
+        self.collect_test_results()
+        self.merge_references()
+        # The timings are compared with the history in the separate runs.
+        self.timing_regressions = []
+        # The shards run in parallel, so the wall time of the merged run is
+        # that of the slowest shard.
+        self.timer = Timer()
+        self.timer.seconds = max([0.0] + [get_wall_time(tstdir) for tstdir in tstdirs])
+        self.refsize = du(self.config.refdir)
+        self.tstsize = du(self.config.tstdir)
+
+    def merge_dir(self, tstdir):
+        print '... Merging', tstdir
+        if not os.path.isdir(tstdir):
+            raise IOError('Test directory "%s" is not present.' % tstdir)
+        for root, dirnames, filenames in os.walk(tstdir):
+            subdir = root[len(tstdir)+1:]
+            dst_dir = os.path.join(self.config.tstdir, subdir)
+            if not os.path.isdir(dst_dir):
+                os.makedirs(dst_dir)
+            for fn in filenames:
+                if len(subdir) == 0 and fn in self.run_files:
+                    continue
+                if fn.endswith('.diff.html'):
+                    continue
+                dst_path = os.path.join(dst_dir, fn)
+                if os.path.exists(dst_path):
+                    if fn.endswith('.pp'):
+                        raise ValueError('The result %s is present in more than one test directory.' % os.path.join(subdir, fn))
+                    # Inputs and related files may be present in several
+                    # test directories.
+                    continue
+                shutil.copy2(os.path.join(root, fn), dst_path)
+
+    def collect_test_results(self):
+        print '... Collecting test results.'
+        test_inputs = find_inputs(self.config.tstdir, self.config.nproc, self.config.indexfile)
+        results = load_results(
+            self.config.tstdir, test_inputs,
+            (lambda summary: not summary.flags['ok'])
+        )
+        # Inputs without a result were not executed, e.g. an unused input that
+        # was copied as a related file.
+        self.test_inputs = []
+        for test_input in test_inputs:
+            test_input.tst_result = results.get(test_input)
+            if test_input.tst_result is not None:
+                self.test_inputs.append(test_input)
+        self.test_inputs.sort(key=(lambda test_input: test_input.path_inp))
+
+    def merge_references(self):
+        # The reference outputs of new and reset tests that passed were only
+        # written in the reference directory of the machine that ran them.
+        # They are copied from the merged test directory, like the driver does.
+        counter = 0
+        for test_input in self.test_inputs:
+            flags = test_input.tst_result.flags
+            if not ((flags['new'] or flags['reset']) and flags['ok']):
+                continue
+            dst_dir = os.path.join(self.config.refdir, os.path.dirname(test_input.path_inp))
+            if not os.path.isdir(dst_dir):
+                os.makedirs(dst_dir)
+            for path in [test_input.path_inp, test_input.path_pp]:
+                copy_file(os.path.join(self.config.tstdir, path), dst_dir)
+            for path in [test_input.path_out, test_input.path_stderr, test_input.path_stdout]:
+                # The output may be compressed in the test directory and the
+                # old reference output may be compressed or not.
+                dst_path = os.path.join(dst_dir, os.path.basename(path))
+                remove_file(dst_path)
+                remove_file(dst_path + '.gz')
+                src_path = find_output(os.path.join(self.config.tstdir, path))
+                if os.path.isfile(src_path):
+                    copy_file(src_path, dst_dir)
+            counter += 1
+        print '... Updated reference outputs of new and reset tests: %i' % counter
+
+
+def get_wall_time(tstdir):
+    '''Return the wall time from the text log of a test run, or zero'''
+    fn = os.path.join(tstdir, 'cpqa.log')
+    if not os.path.isfile(fn):
+        return 0.0
+    f = open(fn)
+    line = f.readline()
+    f.close()
+    words = line.split(':')
+    if len(words) != 2 or words[0] != 'Total wall time [s]':
+        return 0.0
+    return float(words[1])
@@ -0,0 +1,110 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, stat
+
+from cpqa.shell import checksum
+
+
+__all__ = ['ObjectStore']
+
+
+class ObjectStore(object):
+    '''A content-addressed store of files to deduplicate directories.
+
+       Each object is a file whose name is the checksum of its contents. A file
+       is added by replacing it with a hard link to the object with the same
+       contents. Files with the same contents then share the disk space.
+
+       Files in the store must never be modified in place, because all their
+       hard links would change too. Files must be replaced instead, e.g. by
+       removing them before writing a new version.
+    '''
+    # Files that are modified in place.
+    skip = set(['cpqa.sqlite', 'cpqa.sqlite-wal', 'cpqa.sqlite-shm'])
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.mkdir(path)
+
+    def add(self, path):
+        '''Replace a file by a hard link to the object with the same contents
+
+           Returns False when no hard links can be made, e.g. when the file
+           system does not support them. The file is then left untouched.
+        '''
+        key = checksum(path)
+        path_obj = os.path.join(self.path, key[:2], key[2:])
+        dir_obj = os.path.dirname(path_obj)
+        if not os.path.isdir(dir_obj):
+            try:
+                os.mkdir(dir_obj)
+            except OSError:
+                # Created by another process in the meantime.
+                pass
+        if not os.path.isfile(path_obj):
+            try:
+                os.link(path, path_obj)
+                return True
+            except OSError:
+                if not os.path.isfile(path_obj):
+                    return False
+        s_obj = os.stat(path_obj)
+        s = os.stat(path)
+        if s_obj.st_dev == s.st_dev and s_obj.st_ino == s.st_ino:
+            return True
+        # Replace the file atomically.
+        path_tmp = '%s.%i.tmp' % (path, os.getpid())
+        try:
+            os.link(path_obj, path_tmp)
+        except OSError:
+            return False
+        os.rename(path_tmp, path)
+        return True
+
+    def add_tree(self, dirname):
+        '''Add all regular files in a directory that are not linked yet
+
+           Returns the number of files that could not be linked.
+        '''
+        failed = 0
+        for root, dirnames, filenames in os.walk(dirname):
+            for fn in filenames:
+                if fn in self.skip:
+                    continue
+                path = os.path.join(root, fn)
+                s = os.lstat(path)
+                # Symbolic links and files that already have hard links are
+                # left alone.
+                if not stat.S_ISREG(s.st_mode) or s.st_nlink > 1:
+                    continue
+                if not self.add(path):
+                    failed += 1
+        return failed
+
+    def collect_garbage(self):
+        '''Remove the objects that are no longer linked from any directory'''
+        for root, dirnames, filenames in os.walk(self.path):
+            for fn in filenames:
+                path_obj = os.path.join(root, fn)
+                if os.stat(path_obj).st_nlink == 1:
+                    os.remove(path_obj)
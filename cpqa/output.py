@@ -0,0 +1,125 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, mmap, gzip
+
+
+__all__ = ['OutputFile', 'find_output', 'compress_output']
+
+
+def find_output(path):
+    '''Return the path of an output file, which may be compressed'''
+    if not os.path.isfile(path) and os.path.isfile(path + '.gz'):
+        return path + '.gz'
+    return path
+
+
+def compress_output(path):
+    '''Replace an output file by a compressed version with the suffix .gz'''
+    path_gz = path + '.gz'
+    path_tmp = '%s.%i' % (path_gz, os.getpid())
+    f_in = open(path, 'rb')
+    f_tmp = open(path_tmp, 'wb')
+    # Without file name and time stamp, the same outputs give the same
+    # compressed files.
+    f_out = gzip.GzipFile('', 'wb', 9, f_tmp, 0)
+    while True:
+        data = f_in.read(1048576)
+        if len(data) == 0:
+            break
+        f_out.write(data)
+    f_out.close()
+    f_tmp.close()
+    f_in.close()
+    os.rename(path_tmp, path_gz)
+    os.remove(path)
+
+
+class OutputFile(object):
+    '''Read-only access to a (large) output file through a memory map.
+
+       Regular expressions can be used directly on the data attribute, such
+       that only the lines of interest have to be converted into strings.
+
+       When only a compressed version of the file exists (with the suffix
+       .gz), it is decompressed into memory instead.
+    '''
+    def __init__(self, path):
+        self.path = find_output(path)
+        self.mapped = False
+        if self.path.endswith('.gz'):
+            f = gzip.open(self.path, 'rb')
+            self.data = f.read()
+            f.close()
+            self.f = None
+            self.size = len(self.data)
+            return
+        self.f = open(self.path, 'rb')
+        self.size = os.fstat(self.f.fileno()).st_size
+        if self.size > 0:
+            self.data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mapped = True
+        else:
+            # Empty files can not be mapped.
+            self.data = ''
+
+    def close(self):
+        if self.mapped:
+            self.data.close()
+        if self.f is not None:
+            self.f.close()
+
+    def get_line(self, pos):
+        '''Return the line that starts at pos and the position of the next line'''
+        end = self.data.find('\n', pos)
+        if end == -1:
+            end = self.size
+        else:
+            end += 1
+        return self.data[pos:end], end
+
+    def get_line_start(self, pos):
+        '''Return the start of the line that contains pos'''
+        return self.data.rfind('\n', 0, pos) + 1
+
+    def iter_lines(self, pos=0):
+        while pos < self.size:
+            line, pos = self.get_line(pos)
+            yield line
+
+    def readlines(self):
+        lines = self.data[:].split('\n')
+        result = [line + '\n' for line in lines[:-1]]
+        if len(lines[-1]) > 0:
+            result.append(lines[-1])
+        return result
+
+    def tail(self, lines=20):
+        '''Return the last lines, split at the newlines like shell.tail'''
+        if self.size == 0:
+            return []
+        pos = self.size
+        for i in xrange(lines):
+            pos = self.data.rfind('\n', 0, pos)
+            if pos == -1:
+                pos = 0
+                break
+        return self.data[pos:].split('\n')[-lines:]
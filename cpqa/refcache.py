@@ -0,0 +1,108 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, cPickle
+
+from cpqa.output import find_output
+from cpqa.shell import checksum
+
+
+__all__ = ['RefCache']
+
+
+class RefCache(object):
+    '''Harvested reference fragments of one test, stored in the refdir.
+
+       The fragments are keyed by the test command (the directive text). They
+       are only valid for a reference output with the same checksum. The size
+       and modification time of the reference output are stored too, such that
+       the checksum only has to be recomputed when the output was touched. The
+       reference output may be compressed.
+    '''
+    def __init__(self, path_cache, path_out):
+        '''
+           *Arguments:*
+
+           path_cache
+                The file in which the cache is stored.
+
+           path_out
+                The reference output to which the cached fragments belong.
+        '''
+        self.path_cache = path_cache
+        self.path_out = path_out
+        self.checksum = None
+        self.stat = None
+        self.fragments = {}
+        self.changed = False
+        if os.path.isfile(path_cache):
+            try:
+                f = open(path_cache, 'rb')
+                try:
+                    self.checksum, self.stat, self.fragments = cPickle.load(f)
+                finally:
+                    f.close()
+            except Exception:
+                # A broken cache is simply ignored.
+                self.fragments = {}
+        self._validate()
+
+    def _get_stat(self):
+        path_out = find_output(self.path_out)
+        if not os.path.isfile(path_out):
+            return None
+        s = os.stat(path_out)
+        return (path_out, s.st_size, s.st_mtime)
+
+    def _validate(self):
+        stat = self._get_stat()
+        if stat is None:
+            self.fragments = {}
+            return
+        if stat == self.stat:
+            return
+        new_checksum = checksum(stat[0])
+        if new_checksum != self.checksum:
+            self.fragments = {}
+            self.checksum = new_checksum
+        self.stat = stat
+        self.changed = True
+
+    def lookup(self, command):
+        '''Return a cached fragment for the given command, or None'''
+        return self.fragments.get(command)
+
+    def store(self, command, fragment):
+        '''Keep a harvested fragment. Incomplete fragments are not cached.'''
+        if self.stat is None or not fragment.complete():
+            return
+        self.fragments[command] = fragment
+        self.changed = True
+
+    def dump(self):
+        if not self.changed or self.stat is None:
+            return
+        path_tmp = '%s.%i' % (self.path_cache, os.getpid())
+        f = open(path_tmp, 'wb')
+        cPickle.dump((self.checksum, self.stat, self.fragments), f, -1)
+        f.close()
+        os.rename(path_tmp, self.path_cache)
+        self.changed = False
@@ -19,40 +19,91 @@
 # --
 
 
-import os, subprocess, shutil, cPickle, copy
+import os, time
 
-from cpqa.shell import du
+from cpqa.cache import ResultCache
+from cpqa.coverage import get_changed_files, load_coverage, save_coverage, \
+    select_changed
+from cpqa.data import TestResult
+from cpqa.history import open_history, find_timing_regressions, is_timed
+from cpqa.launcher import DriverProcesses, DriverPool
+from cpqa.objects import ObjectStore
+from cpqa.output import compress_output
+from cpqa.scheduler import Scheduler
+from cpqa.selection import select_shard, get_dependency_groups, select_budget, \
+    predict_makespan, get_features
+from cpqa.shell import du, parallel_map, copy_file, link_file, load_pickle, \
+    dump_pickle, remove_file, unshare_file
+from cpqa.store import load_results
 
 
 __all__ = ['Runner']
 
 
+def format_log_line(result):
+    '''Return a line of screen output for a result, like the driver script'''
+    tag = ''
+    for key, value in sorted(result.flags.iteritems()):
+        if value:
+            tag += key[0].upper()
+        else:
+            tag += '-'
+    return '%s %6.2f %6.2f %s' % (tag, result.seconds_bin, result.seconds_script, result.path_inp)
+
+
 class Runner(object):
     def __init__(self, work):
         self.work = work
         self.config = work.config
         test_inputs = self.config.filter_inputs_name(self.work.test_inputs)
+        test_inputs = self.select_changed(test_inputs)
         self.load_references(test_inputs)
         self.test_inputs = self.config.filter_inputs_timing(test_inputs)
         self.select_dependencies()
+        self.select_shard()
+        self.select_budget()
+        self.load_resumed_results()
+        self.load_cached_results()
         self.sort_test_inputs()
-        self.copy_inputs()
         #self.create_makefile()
         #self.run_makefile()
         self.run_tests()
         self.collect_test_results()
+        self.record_coverage()
+        self.check_timings()
+        self.compress_outputs()
+        self.store_cached_results()
+        self.dedup_files()
         self.get_disk_usage()
 
+    def select_changed(self, test_inputs):
+        if self.config.changed is None:
+            return test_inputs
+        print '... Making selection of inputs (based on changed source files).'
+        changed_files = get_changed_files(self.config.root, self.config.changed)
+        coverage = load_coverage(self.config.coveragefile)
+        result, unknown_files = select_changed(test_inputs, coverage, changed_files)
+        print '... Changed source files: %i' % len(changed_files)
+        if len(unknown_files) > 0:
+            print '... Changed files without recorded coverage, selecting all tests:'
+            for path in unknown_files:
+                print '   ', path
+        num_unknown = len([
+            test_input for test_input in result
+            if test_input.path_inp not in coverage
+        ])
+        if num_unknown > 0:
+            print '... Tests without recorded coverage: %i' % num_unknown
+        # The dependencies are added later.
+        print '... Affected tests: %i' % len(result)
+        return result
+
     def load_references(self, test_inputs):
-        # Try to get the reference results.
+        # Try to get the reference results. Only the flags and the timings are
+        # needed.
+        results = load_results(self.config.refdir, test_inputs)
         for test_input in test_inputs:
-            fn = os.path.join(self.config.refdir, test_input.path_pp)
-            if os.path.isfile(fn):
-                f = file(fn)
-                test_input.ref_result = cPickle.load(f)
-                f.close()
-            else:
-                test_input.ref_result = None
+            test_input.ref_result = results.get(test_input)
 
     def _with_dependencies(self, original):
         with_deps = set([])
@@ -81,129 +132,425 @@ class Runner(object):
         self.test_inputs.extend(extra)
         print '... Total number of jobs: %i' % len(self.test_inputs)
 
-    def sort_test_inputs(self):
-        # First compute the timing including the dependencies.
+    def select_shard(self):
+        if self.config.shard is None:
+            return
+        index, num_shards = self.config.shard
+        print '... Selecting shard %i of %i.' % (index, num_shards)
+        # The dependencies are included at this point, such that groups of
+        # dependent jobs can be kept together.
+        self.test_inputs = select_shard(self.test_inputs, index, num_shards)
+        print '... Number of jobs in shard: %i' % len(self.test_inputs)
+
+    def get_previous_failures(self):
+        '''Return the test inputs that did not pass in the previous run'''
+        if self.work.prev_tstdir is None:
+            return set([])
+        prev_results = load_results(self.work.prev_tstdir, self.test_inputs)
+        return set(
+            test_input for test_input, result in prev_results.iteritems()
+            if not result.flags['ok']
+        )
+
+    def select_budget(self):
+        if self.config.budget is None:
+            return
+        print '... Selecting tests for a wall time budget of %.2f seconds.' % self.config.budget
+        # New tests and tests that failed in the previous run are always
+        # selected.
+        mandatory = self.get_previous_failures()
         for test_input in self.test_inputs:
-            # Collect all direct and indirect dependencies and the job itself.
-            with_deps = self._with_dependencies([test_input])
-            sort_key = 0.0
-            for tmp in with_deps:
-                if tmp.ref_result is None:
-                    sort_key = None
-                    break
-                else:
-                    sort_key += tmp.ref_result.seconds
-            test_input.sort_key = sort_key
-        # Sort based on these timings.
-        def compare(ti1, ti2):
-            if ti1.sort_key is None and ti2.sort_key is None:
-                return 0
-            elif ti1.sort_key is None:
-                return +1
-            elif ti2.sort_key is None:
-                return -1
-            else:
-                return cmp(ti1.sort_key, ti2.sort_key)
-        self.test_inputs.sort(compare, reverse=True)
-
-    def copy_inputs(self):
-        print '... Copying inputs and related files.'
-        # Copy only the input files needed to run this batch of tests.
-        # - First make a complete list of paths, including the extra_inputs
-        all_paths = set([])
+            if test_input.ref_result is None:
+                mandatory.add(test_input)
+        selected = select_budget(
+            self.test_inputs, self.config.budget, self.config.nproc,
+            self.config.get_nproc, mandatory
+        )
+        features = set([])
+        for test_input in self.test_inputs:
+            features.update(get_features(test_input))
+        covered = set([])
+        for test_input in sorted(selected, key=(lambda test_input: test_input.path_inp)):
+            covered.update(get_features(test_input))
+            print '   ', test_input.path_inp
+        print '... Number of jobs in budget: %i (%i new or failed)' % (len(selected), len(mandatory))
+        print '... Covered directories and directives: %i of %i' % (len(covered), len(features))
+        print '... Predicted wall time [s]: %.2f' % predict_makespan(
+            selected, self.config.nproc, self.config.get_nproc
+        )
+        self.test_inputs = selected
+
+    def load_resumed_results(self):
         for test_input in self.test_inputs:
-            all_paths.add(test_input.path_inp)
-            for path_extra in test_input.paths_extra:
-                all_paths.add(path_extra)
-        # - Then copy the stuff
-        for path in all_paths:
+            test_input.resumed = False
+        if not self.config.resume:
+            return
+        print '... Looking up the results of the interrupted run.'
+        results = load_results(
+            self.config.tstdir, self.test_inputs,
+            (lambda summary: summary.flags.get('timeout')), True
+        )
+        done = set([])
+        for test_input, result in results.iteritems():
+            # Skipped jobs and jobs that were killed at the deadline are
+            # executed again.
+            if result.flags.get('skipped'):
+                continue
+            if result.flags.get('timeout'):
+                timeout = self.config.get_timeout(test_input)
+                if timeout is None or result.timeout < timeout - 0.5:
+                    continue
+            done.add(test_input)
+        # A result is only kept when the jobs it depends on are kept, because
+        # the latter would overwrite the files it used.
+        changed = True
+        while changed:
+            changed = False
+            for test_input in list(done):
+                if any(depend not in done for depend in test_input.depends):
+                    done.discard(test_input)
+                    changed = True
+        for test_input in done:
+            test_input.tst_result = results[test_input]
+            test_input.resumed = True
+        print '... Number of finished jobs: %i' % len(done)
+
+    def load_cached_results(self):
+        for test_input in self.test_inputs:
+            test_input.cached = False
+        if self.config.result_cache_size is None:
+            self.cache = None
+            return
+        print '... Looking up results in the cache.'
+        self.cache = ResultCache(self.config)
+        self.cache.compute_keys(self.test_inputs)
+        # A cached job does not produce the files that are used by the jobs
+        # that depend on it. Hence, a cached result is only used when all the
+        # jobs that depend on it also have a cached result.
+        dependents = dict((test_input, []) for test_input in self.test_inputs)
+        for test_input in self.test_inputs:
+            for depend in test_input.depends:
+                dependents[depend].append(test_input)
+        hits = set(
+            test_input for test_input in self.test_inputs
+            if not test_input.resumed and self.cache.lookup(test_input)
+        )
+        changed = True
+        while changed:
+            changed = False
+            for test_input in list(hits):
+                if any(dependent not in hits and not dependent.resumed
+                       for dependent in dependents[test_input]):
+                    hits.discard(test_input)
+                    changed = True
+        for test_input in hits:
+            test_input.tst_result = self.cache.restore(test_input, self.config.tstdir)
+            test_input.cached = True
+        print '... Number of cached jobs: %i' % len(hits)
+
+    def sort_test_inputs(self):
+        # Rank the jobs by the length of the longest chain of jobs that depends
+        # on them. The scheduler keeps track of the jobs that are ready to run.
+        # Cached jobs and the jobs that finished before the interruption of a
+        # resumed run are not scheduled and come first.
+        cached = [test_input for test_input in self.test_inputs if test_input.cached or test_input.resumed]
+        todo = [test_input for test_input in self.test_inputs if not (test_input.cached or test_input.resumed)]
+        first = None
+        if self.config.failed_first:
+            first = self.get_previous_failures()
+            print '... Running %i tests that did not pass in the previous run first.' % len(first)
+        self.scheduler = Scheduler(todo, self.config.nproc, self.config.get_nproc, first=first)
+        todo.sort(key=self.scheduler.get_priority)
+        cached.sort(key=(lambda test_input: test_input.path_inp))
+        self.test_inputs = cached + todo
+
+    def prepare_staging(self):
+        # The related files of tests with dependencies are always copied,
+        # because these tests may modify the files of each other.
+        self.copied_paths = set([])
+        # The size, modification time and mode of each linked file.
+        self.linked_paths = {}
+        # The directories of an interrupted run whose files are unshared.
+        self.unshared_dirs = set([])
+        if not self.config.link_inputs:
+            return
+        for group in get_dependency_groups(self.test_inputs):
+            if len(group) > 1:
+                for test_input in group:
+                    self.copied_paths.update(test_input.paths_extra)
+
+    def stage_inputs(self, test_input):
+        # Put the input and related files of a job in the test directory, just
+        # before the job is launched. Files that are already present, e.g.
+        # because an earlier job needed them or wrote them, are left alone.
+        paths = [test_input.path_inp] + test_input.paths_extra
+        for path in paths:
+            dst_path = os.path.join(self.config.tstdir, path)
+            if os.path.exists(dst_path):
+                continue
             src_path = os.path.join(self.config.indir, path)
-            dirname = os.path.dirname(path)
-            dst_dir = os.path.join(self.config.tstdir, dirname)
+            dst_dir = os.path.dirname(dst_path)
             if not os.path.isdir(dst_dir):
                 os.makedirs(dst_dir)
-            shutil.copy(src_path, dst_dir)
+            if self.config.link_inputs and path not in self.copied_paths:
+                link_file(src_path, dst_dir)
+                s = os.stat(src_path)
+                if os.stat(dst_path).st_ino == s.st_ino:
+                    # A test that writes into a linked file would modify the
+                    # file in the directory 'in'. Such writes should fail
+                    # while the tests are running.
+                    os.chmod(src_path, s.st_mode & ~0222)
+                    self.linked_paths[path] = (s.st_size, s.st_mtime, s.st_mode)
+            else:
+                copy_file(src_path, dst_dir)
+
+    def clean_resumed(self, test_input):
+        # The files of an interrupted run may be hard links to the objects
+        # that deduplicate the directories. A job that runs again would write
+        # through these links, so its old outputs are removed and the other
+        # files in its directory, which it may write too, are made private.
+        if not self.config.resume:
+            return
+        for path in [test_input.path_out, test_input.path_stdout,
+                     test_input.path_stderr, test_input.path_pp,
+                     test_input.path_coverage, test_input.path_out + '.diff.html']:
+            path = os.path.join(self.config.tstdir, path)
+            remove_file(path)
+            remove_file(path + '.gz')
+        dirname = os.path.join(self.config.tstdir, os.path.dirname(test_input.path_inp))
+        if dirname in self.unshared_dirs or not os.path.isdir(dirname):
+            return
+        self.unshared_dirs.add(dirname)
+        for fn in os.listdir(dirname):
+            path = os.path.join(dirname, fn)
+            if os.path.isfile(path) and not os.path.islink(path):
+                unshare_file(path)
+
+    def check_linked_inputs(self):
+        # Read-only files can still be modified by the super user. Modified
+        # files are removed from the directory 'in', such that the next import
+        # restores them. The others get their original mode back, because the
+        # importer leaves unchanged files alone.
+        for path, (size, mtime, mode) in sorted(self.linked_paths.iteritems()):
+            src_path = os.path.join(self.config.indir, path)
+            s = os.stat(src_path)
+            if (s.st_size, s.st_mtime) != (size, mtime):
+                print '... Linked file was modified by a test, removing it:', src_path
+                os.remove(src_path)
+            else:
+                os.chmod(src_path, mode | 0200)
 
     def run_tests(self):
-        if self.config.mpi_prefix is None:
-            max_task = self.config.nproc
+        scheduler = self.scheduler
+        if self.config.driver_pool:
+            launcher = DriverPool(self.config.tstdir)
         else:
-            max_task = self.config.nproc/self.config.nproc_mpi
-        todo = copy.copy(self.test_inputs)
-        running = {}
-        done = set([])
-        print '~~~~ ~~~~~~~~~~ ~~~~~~ ~~~~~~ ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'
-        print 'Prog   Flags    Binary Script Test'
-        print '~~~~ ~~~~~~~~~~ ~~~~~~ ~~~~~~ ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'
+            launcher = DriverProcesses(self.config.tstdir)
+        self.prepare_staging()
+        print '... Lower bound on the wall time [s]: %.2f' % scheduler.get_lower_bound()
+        print '~~~~ ~~~~~~~~~~~~~~ ~~~~~~ ~~~~~~ ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'
+        print 'Prog     Flags      Binary Script Test'
+        print '~~~~ ~~~~~~~~~~~~~~ ~~~~~~ ~~~~~~ ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'
         counter = 0.0
-        total = len(todo)
-        waiting = False # Indicate that we are currently waiting on dependencies
-        while len(todo) > 0 or len(running) > 0:
-            # If len(running)==max_task wait for a job to finnish
-            if len(running) >= max_task or len(todo) == 0 or waiting:
-                pid, retcode = os.wait()
-                p, test_input = running.pop(pid)
-                lines = p.stdout.readlines()
+        total = len(self.test_inputs)
+        skipped = set([])
+        num_failed = 0
+        for test_input in self.test_inputs:
+            if test_input.cached or test_input.resumed:
+                counter += 1
+                percent = float(counter)/total*100
+                print '%3.0f%%' % percent, format_log_line(test_input.tst_result)
+        while scheduler.num_todo > 0:
+            # Take the ready job with the highest priority that fits in the
+            # free cores.
+            test_input = scheduler.pop()
+            # If no job can be launched, wait for a job to finnish
+            if test_input is None:
+                test_input, retcode, lines = launcher.wait()
                 if retcode != 0:
                     print 'Test driver script returned a non-zero exit code'
                     for line in lines:
                         print line[:-1]
+                    num_failed += 1
                 else:
                     for line in lines:
                         if line.startswith('CPQA-PREFIX'):
                             counter += 1
                             percent = float(counter)/total*100
                             print '%3.0f%%' % percent, line[12:-1]
+                            # The flags of a test that passed contain an O.
+                            if 'O' not in line.split()[1]:
+                                num_failed += 1
                             break
-                done.add(test_input)
-            waiting = False
-            # Just continue if the todo list is empty
-            if len(todo) == 0:
+                scheduler.finish(test_input)
                 continue
-            # Take a new test input. If none can be found, all todo items are
-            # waiting for dependencies.
-            test_input = None
-            for i in xrange(len(todo)):
-                accepted = True
-                for depend in todo[i].depends:
-                    if depend not in done:
-                        accepted = False
-                        break
-                if accepted:
-                     test_input = todo.pop(i)
-                     break
-            if test_input is None:
-                waiting = True
+            # Skip jobs that can not finish before the deadline or after too
+            # many failures.
+            reason = self.get_skip_reason(test_input, skipped, num_failed)
+            if reason is not None:
+                skipped.add(test_input)
+                result = self.write_skipped(test_input, reason)
+                counter += 1
+                percent = float(counter)/total*100
+                print '%3.0f%%' % percent, format_log_line(result)
+                scheduler.finish(test_input)
                 continue
             # Launch the new job
-            if self.config.mpi_prefix is None:
-                args = [
-                    'cpqa-driver.py',
-                    os.path.abspath(self.config.bin),
-                    test_input.path_inp, self.config.refdir
-                ]
-            else:
-                args = [
-                    'cpqa-driver.py',
-                    os.path.abspath(self.config.bin),
-                    test_input.path_inp, self.config.refdir,
-                    self.config.mpi_prefix
+            self.clean_resumed(test_input)
+            self.stage_inputs(test_input)
+            args = [
+                os.path.abspath(self.config.bin),
+                test_input.path_inp, self.config.refdir
+            ]
+            if self.config.abort_on_divergence:
+                args[:0] = [
+                    '--abort-on-divergence', '--divergence-tolerance',
+                    repr(self.config.divergence_tolerance)
                 ]
-            p = subprocess.Popen(args, cwd=self.config.tstdir, stdout=subprocess.PIPE)
-            running[p.pid] = (p, test_input)
-        print '~~~~ ~~~~~~~~~~ ~~~~~~ ~~~~~~ ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'
+            elif self.config.stream:
+                args.insert(0, '--stream')
+            timeout = self.config.get_timeout(test_input)
+            if self.config.deadline_time is not None:
+                # Running jobs are killed at the deadline.
+                remaining = self.config.deadline_time - time.time()
+                if timeout is None or timeout > remaining:
+                    timeout = remaining
+            if timeout is not None:
+                args.insert(0, '--timeout=%.1f' % timeout)
+            if self.config.link_inputs:
+                args.insert(0, '--link')
+            if self.config.record_coverage:
+                args.insert(0, '--coverage')
+            mpi_prefix = self.config.get_mpi_prefix(test_input)
+            if mpi_prefix is not None:
+                args.append(mpi_prefix)
+            launcher.launch(test_input, args)
+        launcher.close()
+        print '~~~~ ~~~~~~~~~~~~~~ ~~~~~~ ~~~~~~ ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~'
+        self.check_linked_inputs()
+        if len(skipped) > 0:
+            print '... Skipped %i jobs.' % len(skipped)
+
+    def get_skip_reason(self, test_input, skipped, num_failed):
+        '''Return the reason why a job must not be launched, or None'''
+        if self.config.exitfirst_on is not None and num_failed >= self.config.exitfirst_on:
+            return 'The run was stopped after %i failed tests.' % num_failed
+        # The outputs of skipped jobs are missing.
+        for depend in test_input.depends:
+            if depend in skipped:
+                return 'The test %s was skipped.' % depend.path_inp
+        if self.config.deadline_time is None:
+            return None
+        remaining = self.config.deadline_time - time.time()
+        # Jobs without a reference timing are launched while there is time.
+        if remaining <= 0 or (test_input.ref_result is not None and
+                              test_input.ref_result.seconds > remaining):
+            return 'The test could not finish before the deadline.'
+        return None
+
+    def write_skipped(self, test_input, reason):
+        '''Write a test result for a job that was not executed'''
+        flags = {}
+        for key in ['aborted', 'cached', 'different', 'error', 'failed', 'leak',
+                    'missing', 'ok', 'reset', 'timeout', 'verbose', 'wrong']:
+            flags[key] = False
+        flags['new'] = test_input.ref_result is None
+        flags['skipped'] = True
+        result = TestResult(test_input.path_inp, flags, 0.0, 0.0, test_input.tests, [reason], [], [], [])
+        path_pp = os.path.join(self.config.tstdir, test_input.path_pp)
+        dirname = os.path.dirname(path_pp)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        dump_pickle(path_pp, result)
+        return result
 
     def collect_test_results(self):
         print '... Collecting test results.'
+        # The complete results are only needed for the report of the tests
+        # that did not pass.
+        results = load_results(
+            self.config.tstdir, self.test_inputs,
+            (lambda summary: not summary.flags['ok'])
+        )
         for test_input in self.test_inputs:
-            fn = os.path.join(self.config.tstdir, test_input.path_pp)
-            if os.path.isfile(fn):
-                f = file(os.path.join(self.config.tstdir, test_input.path_pp))
-                test_input.tst_result = cPickle.load(f)
-                f.close()
-            else:
-                print 'Could not find', fn
-                test_input.tst_result = None
+            test_input.tst_result = results.get(test_input)
+            if test_input.tst_result is None:
+                print 'Could not find', os.path.join(self.config.tstdir, test_input.path_pp)
+
+    def record_coverage(self):
+        if not self.config.record_coverage:
+            return
+        print '... Recording the source files covered by each test.'
+        coverage = load_coverage(self.config.coveragefile)
+        for test_input in self.test_inputs:
+            covered = load_pickle(os.path.join(self.config.tstdir, test_input.path_coverage))
+            if covered is not None:
+                coverage[test_input.path_inp] = covered
+        save_coverage(self.config.coveragefile, coverage)
+
+    def check_timings(self):
+        self.timing_regressions = []
+        if self.config.history_window is None:
+            return
+        history = open_history(self.config.historyfile)
+        if history is None:
+            return
+        print '... Comparing timings with previous runs.'
+        self.timing_regressions = find_timing_regressions(history, self.config, self.test_inputs)
+        records = []
+        for test_input in self.test_inputs:
+            result = test_input.tst_result
+            if result is not None and is_timed(result):
+                records.append((test_input.path_inp, result.seconds_bin, result.seconds_script))
+        history.add(self.config.bintag, self.config.datetag, records)
+        history.close()
+
+    def store_cached_results(self):
+        if self.cache is None:
+            return
+        print '... Storing results in the cache.'
+        for test_input in self.test_inputs:
+            result = test_input.tst_result
+            if test_input.cached or result is None:
+                continue
+            # A test that ran out of time or failed may succeed in the next
+            # run, e.g. after a problem with the machine. An aborted output is
+            # incomplete.
+            flags = result.flags
+            if flags.get('timeout') or flags.get('skipped') or flags['failed'] or \
+               flags['error'] or flags.get('aborted'):
+                continue
+            self.cache.store(test_input, self.config.tstdir)
+        self.cache.evict(self.config.result_cache_size*1048576)
+
+    def compress_outputs(self):
+        if not self.config.compress_outputs:
+            return
+        # This is only done after all test jobs are finished, because a test
+        # may read the outputs of the tests it depends on.
+        paths = []
+        for test_input in self.test_inputs:
+            for path in test_input.path_out, test_input.path_stdout, test_input.path_stderr:
+                for dirname in self.config.tstdir, self.config.refdir:
+                    path_full = os.path.join(dirname, path)
+                    if os.path.isfile(path_full) and not os.path.islink(path_full):
+                        paths.append(path_full)
+        if len(paths) > 0:
+            print '... Compressing %i output files.' % len(paths)
+            parallel_map(compress_output, paths, self.config.nproc)
+
+    def dedup_files(self):
+        if not self.config.dedup:
+            return
+        # This is only done after all test jobs are finished, because a test
+        # job may modify files in place.
+        print '... Replacing identical files by hard links.'
+        objects = ObjectStore(self.config.objectdir)
+        failed = objects.add_tree(self.config.refdir)
+        failed += objects.add_tree(self.config.tstdir)
+        if failed > 0:
+            print '... Could not make hard links for %i files. Keeping copies.' % failed
+        objects.collect_garbage()
 
     def get_disk_usage(self):
         self.refsize = du(self.config.refdir)
@@ -0,0 +1,321 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import heapq, time
+
+
+__all__ = ['Scheduler']
+
+
+class _ReadyTree(object):
+    '''The ready jobs of one size, sorted by their reference timing.
+
+       A segment tree over all jobs of the size gives the ready job with the
+       highest priority among the shortest jobs in O(log n) time.
+    '''
+    def __init__(self, seconds):
+        '''
+           *Arguments:*
+
+           seconds
+                The sorted reference timings of all jobs of the size.
+        '''
+        self.seconds = seconds
+        self.n = 1
+        while self.n < len(seconds):
+            self.n *= 2
+        # Each node contains the best item of its leaves, or None.
+        self.tree = [None]*(2*self.n)
+
+    def set(self, index, item):
+        '''Put an item (or None) in a leaf and update the nodes above it'''
+        i = index + self.n
+        self.tree[i] = item
+        i /= 2
+        while i > 0:
+            left = self.tree[2*i]
+            right = self.tree[2*i+1]
+            if right is None or (left is not None and left < right):
+                self.tree[i] = left
+            else:
+                self.tree[i] = right
+            i /= 2
+
+    def query(self, stop):
+        '''Return the best item in the leaves before stop, or None'''
+        best = None
+        left = self.n
+        right = stop + self.n
+        while left < right:
+            if left % 2 == 1:
+                item = self.tree[left]
+                if item is not None and (best is None or item < best):
+                    best = item
+                left += 1
+            if right % 2 == 1:
+                right -= 1
+                item = self.tree[right]
+                if item is not None and (best is None or item < best):
+                    best = item
+            left /= 2
+            right /= 2
+        return best
+
+    def count_before(self, now, shadow):
+        '''Return the number of jobs that finish before shadow when started now'''
+        low = 0
+        high = len(self.seconds)
+        while low < high:
+            mid = (low + high)/2
+            if now + self.seconds[mid] <= shadow:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+
+class Scheduler(object):
+    '''Keeps track of the jobs that can be launched.
+
+       Jobs are ranked by the length of the longest chain of jobs that (directly
+       or indirectly) depends on them, including the job itself. The reference
+       timings are used as weights. Jobs whose chain contains a job without a
+       reference timing, e.g. a new test, get priority over all other jobs.
+       Jobs whose chain contains one of the jobs that must run first come
+       before all of these.
+
+       Only jobs whose dependencies are all finished are in the ready queue.
+       The queue is updated when a job is finished. Launched jobs are only
+       removed from the queue when they reach the top. For the backfilling,
+       the ready jobs are also kept in a segment tree for each job size.
+
+       Each job occupies a number of cores while it is running. The total
+       number of cores in use never exceeds the budget. When the job with the
+       highest priority does not fit in the free cores, a smaller job is
+       launched instead (backfilling), but only if it does not delay the job
+       with the highest priority. Based on the reference timings of the
+       running jobs, the scheduler estimates when enough cores become free for
+       that job. A smaller job may only be launched if it is expected to
+       finish before that time, or if it only uses cores that are not needed
+       by the job with the highest priority.
+    '''
+    def __init__(self, test_inputs, budget=1, get_size=None, clock=None, first=None):
+        '''
+           *Arguments:*
+
+           test_inputs
+                The list of test inputs to be scheduled. All dependencies must
+                be included in this list.
+
+           *Optional arguments:*
+
+           budget
+                The number of cores that can be used by the jobs.
+
+           get_size
+                A function that returns the number of cores used by a job. When
+                not given, every job uses one core. Jobs larger than the budget
+                use the entire budget.
+
+           clock
+                A function that returns the current time. The default is
+                time.time. Another clock can be used to simulate a test run.
+
+           first
+                A set of jobs that must run as soon as possible, e.g. the tests
+                that failed in the previous run.
+        '''
+        self.test_inputs = test_inputs
+        if first is None:
+            first = set([])
+        self.first = first
+        if clock is None:
+            clock = time.time
+        self.clock = clock
+        self.budget = budget
+        self.sizes = {}
+        for test_input in test_inputs:
+            if get_size is None:
+                size = 1
+            else:
+                size = get_size(test_input)
+            self.sizes[test_input] = min(size, budget)
+        # The running jobs and the time at which they are expected to finish.
+        self.running = {}
+        self.free = budget
+        # Reverse the dependency graph.
+        self.dependents = dict((test_input, []) for test_input in test_inputs)
+        self.num_waiting = {}
+        for test_input in test_inputs:
+            num_waiting = 0
+            for depend in test_input.depends:
+                if depend in self.dependents:
+                    self.dependents[depend].append(test_input)
+                    num_waiting += 1
+            self.num_waiting[test_input] = num_waiting
+        self._compute_priorities()
+        # Fill the ready queue.
+        self.num_todo = len(test_inputs)
+        self.ready = []
+        self.num_ready = 0
+        self.launched = set([])
+        self.order = dict((test_input, i) for i, test_input in enumerate(test_inputs))
+        by_size = {}
+        for test_input in test_inputs:
+            by_size.setdefault(self.sizes[test_input], []).append((
+                self._get_seconds(test_input), self.order[test_input], test_input
+            ))
+        self.trees = {}
+        self.leaves = {}
+        for size, jobs in by_size.iteritems():
+            jobs.sort()
+            tree = _ReadyTree([seconds for seconds, order, test_input in jobs])
+            self.trees[size] = tree
+            for index, (seconds, order, test_input) in enumerate(jobs):
+                self.leaves[test_input] = (tree, index)
+        for test_input in test_inputs:
+            if self.num_waiting[test_input] == 0:
+                self._push(test_input)
+
+    def _compute_priorities(self):
+        # Make a topological order, starting from the jobs without dependencies.
+        num_waiting = self.num_waiting.copy()
+        topo = [test_input for test_input in self.test_inputs if num_waiting[test_input] == 0]
+        i = 0
+        while i < len(topo):
+            for dependent in self.dependents[topo[i]]:
+                num_waiting[dependent] -= 1
+                if num_waiting[dependent] == 0:
+                    topo.append(dependent)
+            i += 1
+        if len(topo) != len(self.test_inputs):
+            raise ValueError('The dependencies between the test inputs contain a cycle.')
+        # Compute the remaining critical path, starting from the last jobs.
+        for test_input in topo[::-1]:
+            first = test_input in self.first
+            unknown = test_input.ref_result is None
+            length = 0.0
+            for dependent in self.dependents[test_input]:
+                first = first or dependent.first_path
+                unknown = unknown or dependent.unknown_path
+                length = max(length, dependent.critical_path)
+            if test_input.ref_result is not None:
+                length += test_input.ref_result.seconds
+            test_input.first_path = first
+            test_input.unknown_path = unknown
+            test_input.critical_path = length
+
+    def _push(self, test_input):
+        item = (
+            not test_input.first_path, not test_input.unknown_path,
+            -test_input.critical_path, self.order[test_input], test_input
+        )
+        heapq.heappush(self.ready, item)
+        tree, index = self.leaves[test_input]
+        tree.set(index, item)
+        self.num_ready += 1
+
+    def get_priority(self, test_input):
+        '''Return a key that sorts the jobs with the highest priority first'''
+        return (not test_input.first_path, not test_input.unknown_path,
+                -test_input.critical_path)
+
+    def has_ready(self):
+        return self.num_ready > 0
+
+    def _get_seconds(self, test_input):
+        if test_input.ref_result is None:
+            return float('inf')
+        return test_input.ref_result.seconds
+
+    def _start(self, item):
+        test_input = item[-1]
+        self.launched.add(test_input)
+        self.num_ready -= 1
+        tree, index = self.leaves[test_input]
+        tree.set(index, None)
+        self.running[test_input] = self.clock() + self._get_seconds(test_input)
+        self.free -= self.sizes[test_input]
+        return test_input
+
+    def pop(self):
+        '''Return the job to be launched now, or None if no job can be launched
+
+           The returned job is marked as running. Its cores are released when
+           the method finish is called.
+        '''
+        while len(self.ready) > 0 and self.ready[0][-1] in self.launched:
+            heapq.heappop(self.ready)
+        if len(self.ready) == 0:
+            return None
+        first = self.ready[0]
+        size_first = self.sizes[first[-1]]
+        if size_first <= self.free:
+            return self._start(first)
+        # Estimate when the first job can be launched (the shadow time) and
+        # how many cores are not needed by the first job at that time.
+        shadow = float('inf')
+        extra = 0
+        available = self.free
+        for end, test_input in sorted((end, test_input) for test_input, end
+                                      in self.running.iteritems()):
+            available += self.sizes[test_input]
+            if available >= size_first:
+                shadow = end
+                extra = available - size_first
+                break
+        # Backfill with the ready job with the highest priority that fits. For
+        # each size, the tree gives the best job that finishes before the
+        # shadow time, or the best job of all when it fits in the extra cores.
+        now = self.clock()
+        best = None
+        for size, tree in self.trees.iteritems():
+            if size > self.free:
+                continue
+            if size <= extra:
+                item = tree.query(len(tree.seconds))
+            else:
+                item = tree.query(tree.count_before(now, shadow))
+            if item is not None and (best is None or item < best):
+                best = item
+        if best is None:
+            return None
+        return self._start(best)
+
+    def finish(self, test_input):
+        '''Mark a job as finished and queue the jobs that become ready'''
+        self.num_todo -= 1
+        del self.running[test_input]
+        self.free += self.sizes[test_input]
+        for dependent in self.dependents[test_input]:
+            self.num_waiting[dependent] -= 1
+            if self.num_waiting[dependent] == 0:
+                self._push(dependent)
+
+    def get_lower_bound(self):
+        '''Estimate the lower bound on the wall time, ignoring unknown timings'''
+        total = 0.0
+        critical_path = 0.0
+        for test_input in self.test_inputs:
+            if test_input.ref_result is not None:
+                total += test_input.ref_result.seconds*self.sizes[test_input]
+            critical_path = max(critical_path, test_input.critical_path)
+        return max(critical_path, total/self.budget)
@@ -0,0 +1,273 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, heapq
+
+from cpqa.scheduler import Scheduler
+
+
+__all__ = [
+    'get_dependency_groups', 'select_shard', 'predict_makespan', 'get_features',
+    'select_budget',
+]
+
+
+def _get_seconds(test_input, default_seconds):
+    if test_input.ref_result is None:
+        return default_seconds
+    return test_input.ref_result.seconds
+
+
+def get_dependency_groups(test_inputs):
+    '''Split the test inputs in groups that are connected by dependencies.
+
+       The list of test inputs must include all dependencies. The groups are
+       sorted by their first input path and each group is sorted by input path,
+       such that the result does not depend on the order of the test inputs.
+    '''
+    # Union-find on the input paths.
+    parents = dict((test_input.path_inp, test_input.path_inp) for test_input in test_inputs)
+    def find(path):
+        while parents[path] != path:
+            parents[path] = parents[parents[path]]
+            path = parents[path]
+        return path
+    for test_input in test_inputs:
+        for depend in test_input.depends:
+            root1 = find(test_input.path_inp)
+            root2 = find(depend.path_inp)
+            if root1 != root2:
+                parents[max(root1, root2)] = min(root1, root2)
+    groups = {}
+    for test_input in test_inputs:
+        groups.setdefault(find(test_input.path_inp), []).append(test_input)
+    result = []
+    for root, group in sorted(groups.iteritems()):
+        group.sort(key=(lambda test_input: test_input.path_inp))
+        result.append(group)
+    return result
+
+
+def select_shard(test_inputs, index, num_shards, default_seconds=1.0):
+    '''Return the test inputs in one shard of a partition of the test suite.
+
+       *Arguments:*
+
+       test_inputs
+            The list of test inputs to be partitioned. All dependencies must be
+            included in this list.
+
+       index
+            The index of the shard to be selected, counting from one.
+
+       num_shards
+            The total number of shards.
+
+       *Optional arguments:*
+
+       default_seconds
+            The timing used for tests without a reference result.
+
+       Groups of test inputs that are connected by dependencies always end up
+       in the same shard. The groups are assigned one by one, from slow to fast,
+       to the shard with the lowest total reference timing so far. The partition
+       only depends on the input paths and the reference timings.
+    '''
+    groups = []
+    for group in get_dependency_groups(test_inputs):
+        seconds = 0.0
+        for test_input in group:
+            if test_input.ref_result is None:
+                seconds += default_seconds
+            else:
+                seconds += test_input.ref_result.seconds
+        groups.append((-seconds, group[0].path_inp, group))
+    groups.sort()
+    loads = [0.0]*num_shards
+    result = []
+    for neg_seconds, path_inp, group in groups:
+        shard = loads.index(min(loads))
+        loads[shard] -= neg_seconds
+        if shard == index - 1:
+            result.extend(group)
+    return result
+
+
+def predict_makespan(test_inputs, nproc, get_size=None, default_seconds=1.0):
+    '''Return the wall time of a test run, simulated with the reference timings
+
+       *Arguments:*
+
+       test_inputs
+            The list of test inputs to be executed. All dependencies must be
+            included in this list.
+
+       nproc
+            The number of cores that can be used by the jobs.
+
+       *Optional arguments:*
+
+       get_size
+            A function that returns the number of cores used by a job.
+
+       default_seconds
+            The timing used for tests without a reference result.
+
+       The jobs are launched in the same order as in a real test run.
+    '''
+    now = [0.0]
+    scheduler = Scheduler(test_inputs, nproc, get_size, (lambda: now[0]))
+    running = []
+    counter = 0
+    while scheduler.num_todo > 0:
+        test_input = scheduler.pop()
+        if test_input is None:
+            end, i, test_input = heapq.heappop(running)
+            now[0] = end
+            scheduler.finish(test_input)
+            continue
+        end = now[0] + _get_seconds(test_input, default_seconds)
+        heapq.heappush(running, (end, counter, test_input))
+        counter += 1
+    return now[0]
+
+
+def get_features(test_input):
+    '''Return the directory and the test directives covered by a test input'''
+    result = set([('directory', os.path.dirname(test_input.path_inp))])
+    for test in test_input.tests:
+        result.add(('directive', test.directive))
+    return result
+
+
+def select_budget(test_inputs, seconds, nproc, get_size=None, mandatory=None,
+                  default_seconds=1.0):
+    '''Return the test inputs that fit in a wall time budget.
+
+       *Arguments:*
+
+       test_inputs
+            The list of test inputs to select from. All dependencies must be
+            included in this list.
+
+       seconds
+            The wall time budget.
+
+       nproc
+            The number of cores that can be used by the jobs.
+
+       *Optional arguments:*
+
+       get_size
+            A function that returns the number of cores used by a job.
+
+       mandatory
+            A set of test inputs that must be selected, irrespective of the
+            budget.
+
+       default_seconds
+            The timing used for tests without a reference result.
+
+       Groups of test inputs that are connected by dependencies are selected
+       as a whole. After the groups with mandatory tests, the group that covers
+       the most new directories and directives (see get_features) per core
+       second is added, as long as the estimated wall time fits in the budget.
+       The remaining budget is filled with the cheapest groups. The wall time
+       is estimated as the maximum of the core seconds divided by nproc and the
+       longest chain of dependent jobs.
+    '''
+    if mandatory is None:
+        mandatory = set([])
+    groups = []
+    for group in get_dependency_groups(test_inputs):
+        cost = 0.0
+        chains = {}
+        features = set([])
+        required = False
+        # The groups are sorted by input path, not by dependencies.
+        todo = list(group)
+        postponed = set([])
+        while len(todo) > 0:
+            test_input = todo.pop()
+            if test_input in chains:
+                continue
+            missing = [depend for depend in test_input.depends if depend not in chains]
+            if len(missing) > 0:
+                if test_input in postponed:
+                    raise ValueError('The dependencies between the test inputs contain a cycle.')
+                postponed.add(test_input)
+                todo.append(test_input)
+                todo.extend(missing)
+                continue
+            if get_size is None:
+                size = 1
+            else:
+                size = min(get_size(test_input), nproc)
+            test_seconds = _get_seconds(test_input, default_seconds)
+            cost += test_seconds*size
+            chains[test_input] = test_seconds + max([0.0] + [chains[depend] for depend in test_input.depends])
+            features.update(get_features(test_input))
+            required = required or test_input in mandatory
+        groups.append((group, cost, max(chains.values()), features, required))
+
+    selected = []
+    covered = set([])
+    state = [0.0, 0.0]
+    def add(group, cost, chain, features):
+        selected.extend(group)
+        covered.update(features)
+        state[0] += cost
+        state[1] = max(state[1], chain)
+    def fits(cost, chain):
+        return max((state[0] + cost)/nproc, state[1], chain) <= seconds
+
+    # First the mandatory groups.
+    for group, cost, chain, features, required in groups:
+        if required:
+            add(group, cost, chain, features)
+    # Then the groups with the best coverage per core second. The gain of a
+    # group can only decrease, such that it only has to be recomputed when
+    # the group is on top of the queue.
+    queue = []
+    for i, (group, cost, chain, features, required) in enumerate(groups):
+        if not required:
+            queue.append((-len(features)/max(cost, 1e-3), i))
+    heapq.heapify(queue)
+    leftovers = []
+    while len(queue) > 0:
+        neg_ratio, i = heapq.heappop(queue)
+        group, cost, chain, features, required = groups[i]
+        gain = len(features - covered)
+        if gain == 0:
+            leftovers.append((cost, i))
+            continue
+        ratio = gain/max(cost, 1e-3)
+        if len(queue) > 0 and ratio < -queue[0][0]:
+            heapq.heappush(queue, (-ratio, i))
+            continue
+        if fits(cost, chain):
+            add(group, cost, chain, features)
+    # Fill the remaining budget with the cheapest groups.
+    for cost, i in sorted(leftovers):
+        group, cost, chain, features, required = groups[i]
+        if fits(cost, chain):
+            add(group, cost, chain, features)
+    return selected
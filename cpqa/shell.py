@@ -19,38 +19,166 @@
 # --
 
 
-import os
+import os, stat, shutil, hashlib, cPickle, multiprocessing
 
+from cpqa.output import OutputFile, find_output
 
-__all__ = ['du', 'tail']
+
+__all__ = ['du', 'tail', 'checksum', 'load_pickle', 'dump_pickle',
+           'parallel_map', 'copy_file', 'link_file', 'remove_file',
+           'unshare_file']
 
 
 def du(dirname):
+    # Files with several hard links in the directory are counted once.
     result = 0
+    inodes = set([])
     for dirpath, dirnames, filenames in os.walk(dirname):
-        result += sum(
-            os.path.getsize(os.path.join(dirpath, fn))
-            for fn in filenames
-        )
+        for fn in filenames:
+            s = os.stat(os.path.join(dirpath, fn))
+            inode = (s.st_dev, s.st_ino)
+            if inode not in inodes:
+                inodes.add(inode)
+                result += s.st_size
     return result
 
 
+def _copy_writable(src, dst):
+    # The copy is always writable by the owner, also when the source is a
+    # read-only hard link of a linked input.
+    shutil.copyfile(src, dst)
+    os.chmod(dst, stat.S_IMODE(os.stat(src).st_mode) | stat.S_IWUSR)
+
+
+def copy_file(src, dst_dir):
+    '''Copy a file into a directory, replacing an existing file
+
+       The existing file is removed first instead of being overwritten, because
+       it may be a hard link that is shared with other files.
+    '''
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    if os.path.isfile(dst):
+        os.remove(dst)
+    _copy_writable(src, dst)
+
+
+def link_file(src, dst_dir):
+    '''Hard link a file into a directory, replacing an existing file
+
+       The file is copied when the hard link can not be made, e.g. because the
+       directory is on another file system.
+    '''
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    if os.path.isfile(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        _copy_writable(src, dst)
+
+
+def remove_file(fn):
+    '''Remove a file if it exists
+
+       A file that may be a shared hard link must be removed before it is
+       written again, because opening it for writing would modify all links.
+    '''
+    if os.path.isfile(fn):
+        os.remove(fn)
+
+
+def unshare_file(fn):
+    '''Replace a file with several hard links by a private copy'''
+    if os.stat(fn).st_nlink > 1:
+        fn_tmp = '%s.%i' % (fn, os.getpid())
+        shutil.copy(fn, fn_tmp)
+        os.rename(fn_tmp, fn)
+
+
 def tail(fn, lines=20):
-    # Taken from stackoverflow with some small changes.
-    # http://stackoverflow.com/questions/136168/get-last-n-lines-of-a-file-with-python-similar-to-tail
-    f = open(fn)
-    f.seek(0, 2)
-    size = f.tell()
-    lines_found = 0
-    data = ''
-    while lines+1 > lines_found and size > len(data):
-        read_size = min(1024, size-len(data))
-        f.seek(-(read_size+len(data)), 2)
-        new_data = f.read(read_size)
-        data = new_data + data
-        lines_found += new_data.count('\n')
-    f.close()
-    if len(data) == 0:
+    '''Return the last lines of a file, or an empty list if it does not exist
+
+       A test that is killed may not have created all its output files.
+    '''
+    if not os.path.isfile(find_output(fn)):
         return []
-    else:
-        return data.split('\n')[-lines:]
+    output = OutputFile(fn)
+    result = output.tail(lines)
+    output.close()
+    return result
+
+
+def checksum(fn):
+    m = hashlib.md5()
+    f = open(fn, 'rb')
+    while True:
+        data = f.read(1048576)
+        if len(data) == 0:
+            break
+        m.update(data)
+    f.close()
+    return m.hexdigest()
+
+
+def load_pickle(fn):
+    '''Return the object in a pickle file, or None if it can not be loaded'''
+    if not os.path.isfile(fn):
+        return None
+    try:
+        f = open(fn, 'rb')
+        try:
+            return cPickle.load(f)
+        finally:
+            f.close()
+    except Exception:
+        return None
+
+
+def dump_pickle(fn, obj):
+    '''Write an object to a pickle file, replacing the file atomically'''
+    fn_tmp = '%s.%i' % (fn, os.getpid())
+    f = open(fn_tmp, 'wb')
+    cPickle.dump(obj, f, -1)
+    f.close()
+    os.rename(fn_tmp, fn)
+
+
+def _call_safe(args):
+    function, item = args
+    try:
+        return True, function(item)
+    except Exception, e:
+        return False, e
+
+
+def parallel_map(function, items, nproc):
+    '''Apply a function to all items with a pool of processes.
+
+       *Arguments:*
+
+       function
+            A function defined at the module level, such that it can be
+            pickled. It is called with one item as argument.
+
+       items
+            A list of picklable items.
+
+       nproc
+            The maximum number of processes.
+
+       The results are returned in the order of the items. When the function
+       raises an exception for some items, the exception of the first of these
+       items is raised, as with the builtin map.
+    '''
+    if nproc <= 1 or len(items) <= 1:
+        return map(function, items)
+    pool = multiprocessing.Pool(min(nproc, len(items)))
+    try:
+        results = pool.map(_call_safe, [(function, item) for item in items], 1)
+    finally:
+        pool.close()
+        pool.join()
+    for success, value in results:
+        if not success:
+            raise value
+    return [value for success, value in results]
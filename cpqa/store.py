@@ -0,0 +1,195 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, cPickle
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+
+__all__ = ['ResultSummary', 'ResultStore', 'open_store', 'load_results']
+
+
+class ResultSummary(object):
+    '''The flags and timings of a TestResult, without the tests and outputs'''
+    def __init__(self, path_inp, flags, seconds_bin, seconds):
+        self.path_inp = path_inp
+        self.flags = flags
+        self.seconds_bin = seconds_bin
+        self.seconds = seconds
+        # derived
+        self.seconds_script = seconds - seconds_bin
+
+
+class ResultStore(object):
+    '''An SQLite database with the results of the tests in one directory.
+
+       The flags, the timings and the harvested scalar values are kept in
+       indexed tables, such that they can be queried without loading the
+       pickle files of the test results. The pickle files remain the complete
+       record. An entry in the store is only valid when the pickle file still
+       has the modification time that was stored with the entry.
+
+       The database is used in WAL mode, such that several driver scripts can
+       add results concurrently.
+    '''
+    def __init__(self, dirname):
+        self.path = os.path.join(dirname, 'cpqa.sqlite')
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS results (
+                path_inp TEXT PRIMARY KEY, mtime REAL, seconds_bin REAL,
+                seconds REAL);
+            CREATE TABLE IF NOT EXISTS flags (
+                path_inp TEXT, flag TEXT, value INTEGER,
+                PRIMARY KEY (path_inp, flag));
+            CREATE INDEX IF NOT EXISTS flags_value ON flags (flag, value);
+            CREATE TABLE IF NOT EXISTS harvested (
+                path_inp TEXT, command TEXT, value REAL);
+            CREATE INDEX IF NOT EXISTS harvested_path_inp ON harvested (path_inp);
+        ''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, result, path_pp):
+        '''Add or replace a TestResult, stored in the pickle file path_pp'''
+        path_inp = result.path_inp
+        c = self.connection
+        c.execute('DELETE FROM results WHERE path_inp=?', (path_inp,))
+        c.execute('DELETE FROM flags WHERE path_inp=?', (path_inp,))
+        c.execute('DELETE FROM harvested WHERE path_inp=?', (path_inp,))
+        c.execute('INSERT INTO results VALUES (?, ?, ?, ?)', (
+            path_inp, os.path.getmtime(path_pp), result.seconds_bin, result.seconds
+        ))
+        c.executemany('INSERT INTO flags VALUES (?, ?, ?)', [
+            (path_inp, key, bool(value)) for key, value in result.flags.iteritems()
+        ])
+        for test in getattr(result, 'tests', []):
+            value = getattr(getattr(test, 'tst', None), 'value', None)
+            if value is not None:
+                c.execute('INSERT INTO harvested VALUES (?, ?, ?)', (
+                    path_inp, test.get_command(), value
+                ))
+        c.commit()
+
+    def load_summaries(self):
+        '''Return a dictionary with (mtime, ResultSummary) for each input path'''
+        flags = {}
+        for path_inp, key, value in self.connection.execute('SELECT path_inp, flag, value FROM flags'):
+            flags.setdefault(path_inp, {})[str(key)] = bool(value)
+        result = {}
+        for path_inp, mtime, seconds_bin, seconds in self.connection.execute('SELECT * FROM results'):
+            path_inp = str(path_inp)
+            result[path_inp] = (mtime, ResultSummary(
+                path_inp, flags.get(path_inp, {}), seconds_bin, seconds
+            ))
+        return result
+
+    def select_flag(self, flag, value=True):
+        '''Return the input paths of the results with the given flag value'''
+        return [str(row[0]) for row in self.connection.execute(
+            'SELECT path_inp FROM flags WHERE flag=? AND value=?', (flag, value)
+        )]
+
+    def get_values(self, path_inp):
+        '''Return a list of (command, value) with the harvested scalars of a test'''
+        return [(str(command), value) for command, value in self.connection.execute(
+            'SELECT command, value FROM harvested WHERE path_inp=?', (path_inp,)
+        )]
+
+
+def open_store(dirname):
+    '''Return a ResultStore for a directory, or None if SQLite is not available'''
+    if sqlite3 is None:
+        return None
+    try:
+        return ResultStore(dirname)
+    except sqlite3.Error:
+        return None
+
+
+def load_results(dirname, test_inputs, need_full=None, skip_broken=False):
+    '''Load the test results of the given inputs from a directory.
+
+       *Arguments:*
+
+       dirname
+            The directory with the test results, e.g. a test or reference
+            directory.
+
+       test_inputs
+            The test inputs whose results must be loaded.
+
+       *Optional arguments:*
+
+       need_full
+            A function that gets a ResultSummary and returns True when the
+            complete TestResult is needed.
+
+       skip_broken
+            When True, pickle files that can not be loaded, e.g. because a
+            test run was interrupted while writing them, are ignored.
+
+       Returns a dictionary with a result for each test input that has a
+       pickle file. When possible, a ResultSummary from the store is used
+       instead of the pickle file. Results that are missing in the store are
+       added to it.
+    '''
+    store = open_store(dirname)
+    if store is None:
+        summaries = {}
+    else:
+        summaries = store.load_summaries()
+    results = {}
+    for test_input in test_inputs:
+        path_pp = os.path.join(dirname, test_input.path_pp)
+        if not os.path.isfile(path_pp):
+            continue
+        mtime, summary = summaries.get(test_input.path_inp, (None, None))
+        if mtime == os.path.getmtime(path_pp) and \
+           (need_full is None or not need_full(summary)):
+            results[test_input] = summary
+            continue
+        f = file(path_pp)
+        try:
+            result = cPickle.load(f)
+        except Exception:
+            if not skip_broken:
+                raise
+            continue
+        finally:
+            f.close()
+        results[test_input] = result
+        if store is not None and mtime != os.path.getmtime(path_pp):
+            try:
+                store.add(result, path_pp)
+            except sqlite3.Error:
+                # The store is only an index, e.g. the directory may be
+                # read-only.
+                pass
+    if store is not None:
+        store.close()
+    return results
@@ -21,18 +21,29 @@
 
 import os, re, sys, traceback, numpy
 
+from cpqa.harvest import Harvester
 from cpqa.log import diff_html, diff_txt
-from cpqa.shell import tail
+from cpqa.output import OutputFile, find_output
+from cpqa.refcache import RefCache
+from cpqa.shell import tail, remove_file
 
 
 __all__ = [
-    'test_factories', 'harvest_test'
+    'test_factories', 'harvest_test', 'harvest_ref', 'update_refcache'
 ]
 
 
 class Fragment(object):
     def __init__(self):
         self.lines = []
+        # When active, the fragment must see every line of the output.
+        self.active = False
+        # When history is a list, all matching lines are recorded.
+        self.history = None
+
+    def get_regexes(self):
+        '''Return the regexes that must match a line before it is fed.'''
+        raise NotImplementedError
 
     def feed(self, line):
         raise NotImplementedError
@@ -53,10 +64,15 @@ class ScalarFragment(Fragment):
         self.value = None
         Fragment.__init__(self)
 
+    def get_regexes(self):
+        return [self.regex]
+
     def feed(self, line):
         match = self.compiled.search(line)
         if match is not None:
             self.lines = [line]
+            if self.history is not None:
+                self.history.append(line)
 
     def digest(self):
         if len(self.lines) == 1:
@@ -76,16 +92,22 @@ class ArrayFragment(Fragment):
         self.skip = skip
         # internal stuff
         self.status = 0
-        self.lines = []
+        self.data = None
+        Fragment.__init__(self)
+
+    def get_regexes(self):
+        return [self.regex_start]
 
     def feed(self, line):
         if self.status == 0 and (self.compiled_start.search(line) is not None):
             self.status = 1
+            self.active = True
             self.toskip = self.skip
             self.lines = []
         elif self.status == 1:
             if (self.compiled_stop.search(line) is not None):
                 self.status = 0
+                self.active = False
             elif self.toskip > 0:
                 self.toskip -= 1
             else:
@@ -93,25 +115,31 @@ class ArrayFragment(Fragment):
 
     def digest(self):
         if len(self.lines) > 0:
-            data = []
-            for line in self.lines:
-                row = []
-                words = line.split()
-                for c in self.columns:
-                    row.append(float(words[c]))
-                data.append(row)
-            self.data = numpy.array(data)
+            rows = [line.split() for line in self.lines]
+            if len(set(len(row) for row in rows)) == 1:
+                # All lines have the same number of words, select the columns
+                # and convert them in one go.
+                self.data = numpy.array(rows)[:,self.columns].astype(float)
+            else:
+                self.data = numpy.array([
+                    [row[c] for c in self.columns] for row in rows
+                ]).astype(float)
         else:
             self.data = None
 
+    def complete(self):
+        return self.data is not None
+
 
-def harvest_test(test_input, refdir, new, messages):
+def harvest_test(test_input, refdir, new, messages, streamed=False):
     if not new:
-        path_out = os.path.join(refdir, test_input.path_out)
-        fragments = [test.ref for test in test_input.tests if hasattr(test, 'ref')]
-        harvest_file(path_out, fragments, messages)
+        harvest_ref(test_input, refdir, messages)
     fragments = [test.tst for test in test_input.tests if hasattr(test, 'tst')]
-    harvest_file(test_input.path_out, fragments, messages)
+    if streamed:
+        # The lines were already fed while the test was running.
+        digest_fragments(fragments, messages)
+    else:
+        harvest_file(test_input.path_out, fragments, messages)
     for test in test_input.tests:
         try:
             test.harvest_other(test_input, messages)
@@ -119,14 +147,54 @@ def harvest_test(test_input, refdir, new, messages):
             messages.append(traceback.format_exc())
 
 
+def harvest_ref(test_input, refdir, messages, use_cache=True):
+    '''Harvest the reference fragments that are not complete yet.'''
+    path_out = os.path.join(refdir, test_input.path_out)
+    tests = [
+        test for test in test_input.tests
+        if hasattr(test, 'ref') and not test.ref.complete()
+    ]
+    if not use_cache:
+        harvest_file(path_out, [test.ref for test in tests], messages)
+        return
+    # Reference fragments are taken from the cache when possible.
+    cache = RefCache(os.path.join(refdir, test_input.path_refcache), path_out)
+    todo = []
+    for test in tests:
+        fragment = cache.lookup(test.get_command())
+        if fragment is None:
+            todo.append(test)
+        else:
+            test.ref = fragment
+    if len(todo) > 0:
+        harvest_file(path_out, [test.ref for test in todo], messages)
+        for test in todo:
+            cache.store(test.get_command(), test.ref)
+        cache.dump()
+
+
+def update_refcache(test_input, refdir):
+    '''Cache the harvested test fragments as the new reference fragments.'''
+    cache = RefCache(
+        os.path.join(refdir, test_input.path_refcache),
+        os.path.join(refdir, test_input.path_out)
+    )
+    for test in test_input.tests:
+        if hasattr(test, 'ref') and hasattr(test, 'tst'):
+            cache.store(test.get_command(), test.tst)
+    cache.dump()
+
+
 def harvest_file(path_out, fragments, messages):
-    if not os.path.isfile(path_out):
+    if not os.path.isfile(find_output(path_out)):
         return
-    f = file(path_out)
-    for line in f:
-        for fragment in fragments:
-            fragment.feed(line)
-    f.close()
+    output = OutputFile(path_out)
+    Harvester(fragments).harvest(output)
+    output.close()
+    digest_fragments(fragments, messages)
+
+
+def digest_fragments(fragments, messages):
     for fragment in fragments:
         try:
             fragment.digest()
@@ -151,6 +219,19 @@ class Test(object):
     def harvest_other(self, test_input, messages):
         pass
 
+    def follow(self):
+        '''Prepare for the comparison with the reference while the test runs.'''
+        pass
+
+    def diverged(self, tolerance):
+        '''Return True when the output so far deviates from the reference.
+
+           The tolerance is the largest relative deviation that is accepted.
+           It is independent of the thresholds in the directives, because
+           those are meant for the comparison with expected values.
+        '''
+        return False
+
     def complete(self, new):
         raise NotImplementedError
 
@@ -186,6 +267,32 @@ class ScalarTest(Test):
                 self.exp_value, self.threshold
             )
 
+    def follow(self):
+        self.ref.history = []
+        self.tst.history = []
+        self.num_checked = 0
+
+    def diverged(self, tolerance):
+        # Compare each matching line in the test output with the corresponding
+        # line in the reference output.
+        if self.ref.history is None or self.tst.history is None:
+            return False
+        num = min(len(self.ref.history), len(self.tst.history))
+        while self.num_checked < num:
+            i = self.num_checked
+            self.num_checked += 1
+            try:
+                ref_value = float(self.ref.history[i].split()[self.column])
+                tst_value = float(self.tst.history[i].split()[self.column])
+            except (ValueError, IndexError):
+                continue
+            if ref_value == 0.0:
+                if abs(tst_value) > tolerance:
+                    return True
+            elif abs((tst_value - ref_value)/ref_value) > tolerance:
+                return True
+        return False
+
     def complete(self, new):
         return self.tst.complete() and (new or self.ref.complete())
 
@@ -288,6 +395,87 @@ class CompareScalarTest(ScalarTest):
             diff_html(f, self.exp.lines, self.tst.lines, 'exp', 'tst')
 
 
+class ArrayTest(Test):
+    def __init__(self, directive, regex_start, regex_stop, columns, skip=0,
+                 rtol=1e-15, atol=None):
+        self.regex_start = regex_start
+        self.regex_stop = regex_stop
+        self.columns = columns
+        self.skip = skip
+        # Without an absolute tolerance, the relative one is used for both.
+        if atol is None:
+            atol = rtol
+        self.rtol = rtol
+        self.atol = atol
+        self.ref = ArrayFragment(regex_start, regex_stop, columns, skip)
+        self.tst = ArrayFragment(regex_start, regex_stop, columns, skip)
+        Test.__init__(self, directive)
+
+    def get_command(self):
+        if self.atol == self.rtol:
+            tolerances = '%s' % self.rtol
+        else:
+            tolerances = '%s %s' % (self.rtol, self.atol)
+        return '%s \'%s\' \'%s\' %s %i %s' % (
+            self.directive.upper(), self.regex_start, self.regex_stop,
+            ','.join(str(c) for c in self.columns), self.skip, tolerances
+        )
+
+    def complete(self, new):
+        return self.tst.complete() and (new or self.ref.complete())
+
+    def run(self, new, num_worst=5):
+        self.worst = []
+        if new:
+            self.different = None
+            return
+        if self.tst.data.shape != self.ref.data.shape:
+            self.different = True
+            return
+        # An element differs when the error exceeds atol + rtol*|ref|. The
+        # ratio of the error and this tolerance ranks the worst offenders.
+        error = abs(self.tst.data - self.ref.data)
+        tolerance = self.atol + self.rtol*abs(self.ref.data)
+        ratio = error/numpy.maximum(tolerance, numpy.finfo(float).tiny)
+        self.different = bool((error > tolerance).any())
+        if self.different:
+            # Keep the worst offenders for the log files.
+            order = ratio.ravel().argsort()[::-1][:num_worst]
+            for index in order:
+                if ratio.flat[index] <= 1:
+                    break
+                row, col = divmod(index, ratio.shape[1])
+                self.worst.append((
+                    row, self.columns[col], self.ref.data[row,col],
+                    self.tst.data[row,col], error[row,col]
+                ))
+
+    def log_txt(self, f):
+        if self.different is True:
+            if self.tst.data.shape != self.ref.data.shape:
+                print >> f, '    tst shape %s    ref shape %s' % (
+                    self.tst.data.shape, self.ref.data.shape
+                )
+            for row, column, ref_value, tst_value, error in self.worst:
+                print >> f, '    row %5i col %3i    tst % .8e    ref % .8e    abs err % .8e' % (
+                    row, column, tst_value, ref_value, error
+                )
+
+    def log_html(self, f):
+        if self.different is True:
+            print >> f, '<table>'
+            if self.tst.data.shape != self.ref.data.shape:
+                print >> f, '<tr><th>tst shape</th><td>%s</td>' % (self.tst.data.shape,)
+                print >> f, '<th>ref shape</th><td>%s</td></tr>' % (self.ref.data.shape,)
+            else:
+                print >> f, '<tr><th>row</th><th>col</th><th>tst</th><th>ref</th><th>abs err</th></tr>'
+                for row, column, ref_value, tst_value, error in self.worst:
+                    print >> f, '<tr><td>%i</td><td>%i</td><td>% .15e</td><td>% .15e</td><td>% .15e</td></tr>' % (
+                        row, column, tst_value, ref_value, error
+                    )
+            print >> f, '</table>'
+
+
 class ScriptTest(Test):
     def __init__(self, directive, script, args):
         self.script = script
@@ -307,6 +495,9 @@ class ScriptTest(Test):
         log_prefix = self.args[0] + '-' + self.script
         if len(self.args) > 1:
             log_prefix += '-' + '-'.join(self.args[1:])
+        # The logs of an interrupted run may be shared hard links.
+        for suffix in '.stdout', '.stderr':
+            remove_file(os.path.join(self.dirname, log_prefix + suffix))
         self.return_code = os.system('cd %s; ./%s %s > %s.stdout 2> %s.stderr' % (
             self.dirname, self.script, ' '.join(self.args), log_prefix, log_prefix
         ))
@@ -382,6 +573,31 @@ class CompareScalarFactory(object):
             raise TypeError('There must be three arguments for a custom scalar comparison.')
 
 
+class ArrayFactory(object):
+    def __init__(self):
+        self.directive = 'array'
+
+    def __call__(self, words):
+        if len(words) >= 3 and len(words) <= 6:
+            regex_start, regex_stop, columns = words[:3]
+            columns = [int(c) for c in columns.split(',')]
+            if len(words) >= 4:
+                skip = int(words[3])
+            else:
+                skip = 0
+            if len(words) >= 5:
+                rtol = float(words[4])
+            else:
+                rtol = 1e-15
+            if len(words) == 6:
+                atol = float(words[5])
+            else:
+                atol = None
+            return ArrayTest(self.directive, regex_start, regex_stop, columns, skip, rtol, atol)
+        else:
+            raise TypeError('There must be three to six arguments for an array test.')
+
+
 class ScriptFactory(object):
     def __init__(self):
         self.directive = 'script'
@@ -398,6 +614,7 @@ class ScriptFactory(object):
 test_factories = [
     ScalarFactory(),
     CompareScalarFactory(),
+    ArrayFactory(),
     ScriptFactory(),
 ]
 test_factories = dict((test.directive, test) for test in test_factories)
@@ -22,6 +22,7 @@
 import os, shutil, random
 
 from cpqa.data import TestInput
+from cpqa.shell import load_pickle, dump_pickle, parallel_map
 
 
 __all__ = ['Work', 'LastWork']
@@ -42,19 +43,118 @@ def is_binary(filename):
     return False
 
 
-def find_inputs(indir):
-    test_inputs = []
+def parse_inputs(group):
+    '''Parse a group of inputs in the same directory.
+
+       Returns a list with for each input a TestInput object, None when the
+       input is binary or has no CPQA directives, or the exception raised for
+       that input.
+    '''
+    indir, paths_inp = group
+    # Directory listings to detect the extra files of the inputs.
+    listings = {}
+    results = []
+    for path_inp in paths_inp:
+        try:
+            if is_binary(os.path.join(indir, path_inp)):
+                test_input = None
+            else:
+                test_input = TestInput(indir, path_inp, listings)
+                if not test_input.active:
+                    test_input = None
+            results.append(test_input)
+        except Exception, e:
+            results.append(e)
+    return results
+
+
+# The version of the index file. It must be increased when the attributes of
+# TestInput change, such that old test inputs are not taken from the index.
+index_version = 3
+
+
+def get_stamp(indir, path):
+    '''Return the size and modification time of a file or directory, or None'''
+    try:
+        s = os.stat(os.path.join(indir, path))
+    except OSError:
+        return None
+    return s.st_size, s.st_mtime
+
+
+def get_extra_stamps(indir, test_input):
+    # The extra files of a test input change when one of them is modified,
+    # or when a file appears or disappears in a directory that was searched.
+    if not isinstance(test_input, TestInput):
+        return ()
+    paths = sorted(set(test_input.paths_extra) | test_input.dirs_searched |
+                   set(os.path.dirname(path) for path in test_input.paths_extra))
+    return tuple((path, get_stamp(indir, path)) for path in paths)
+
+
+def find_inputs(indir, nproc=1, path_index=None):
+    # The parsed inputs are kept in an index file, which is shared by all
+    # directories that are searched, e.g. 'in' and the test directories. An
+    # entry is reused when the size and modification time of the input, of
+    # its extra files and of the directories in which extra files were looked
+    # up did not change.
+    if path_index is None:
+        index = {}
+    else:
+        index = load_pickle(path_index)
+        if not isinstance(index, tuple) or index[0] != index_version:
+            index = {}
+        else:
+            index = index[1]
+    old_entries = index.get(os.path.normpath(indir), {})
+    new_entries = {}
+    candidates = []
+    groups = []
     for root, dirnames, filenames in os.walk(indir):
+        paths_todo = []
         for fn_inp in filenames:
             if not (fn_inp.endswith('.inp') or fn_inp.endswith('.restart')):
                 continue
             path_inp = os.path.join(root[len(indir)+1:], fn_inp)
-            if is_binary(os.path.join(indir, path_inp)):
-                continue
-            test_input = TestInput(indir, path_inp)
-            if not test_input.active:
-                continue
+            key = get_stamp(indir, path_inp)
+            candidates.append(path_inp)
+            entry = old_entries.get(path_inp)
+            if entry is not None and entry[0] == key and \
+               entry[1] == get_extra_stamps(indir, entry[2]):
+                new_entries[path_inp] = entry
+            else:
+                new_entries[path_inp] = (key, None, None)
+                paths_todo.append(path_inp)
+        if len(paths_todo) > 0:
+            groups.append((indir, paths_todo))
+    # Parse the new and modified inputs with a pool of processes.
+    for group, results in zip(groups, parallel_map(parse_inputs, groups, nproc)):
+        for path_inp, result in zip(group[1], results):
+            new_entries[path_inp] = (
+                new_entries[path_inp][0], get_extra_stamps(indir, result),
+                result
+            )
+    # Collect the test inputs in the order of the directory walk and report
+    # the same error as a serial search.
+    test_inputs = []
+    for path_inp in candidates:
+        test_input = new_entries[path_inp][2]
+        if isinstance(test_input, Exception):
+            raise test_input
+        if test_input is not None:
             test_inputs.append(test_input)
+    # The index is written before the test inputs are modified. Entries of
+    # directories that were removed in the meantime are dropped.
+    if path_index is not None and new_entries != old_entries:
+        new_index = {os.path.normpath(indir): new_entries}
+        for dirname, entries in index.iteritems():
+            if dirname not in new_index and os.path.isdir(dirname):
+                new_index[dirname] = entries
+        try:
+            dump_pickle(path_index, (index_version, new_index))
+        except (IOError, OSError):
+            # The index is only an optimization.
+            pass
     return test_inputs
 
 
@@ -67,16 +167,24 @@ class Work(object):
             raise IOError('Input directory "%s" is not present.' % config.indir)
         if not os.path.isdir(config.refdir):
             os.mkdir(config.refdir)
-        if os.path.isdir(config.tstdir):
-            raise IOError('Test directory "%s" is already present.' % config.tstdir)
-        os.mkdir(config.tstdir)
-        # Keep a link to the last test directory.
-        if os.path.islink(config.lastlink):
-            os.remove(config.lastlink)
-        if not os.path.isfile(config.lastlink):
-            os.symlink(config.tstdir, config.lastlink)
+        # Keep a link to the last test directory. The previous test directory
+        # is remembered for the selection of tests.
+        self.prev_tstdir = None
+        if config.resume:
+            # The last test directory is reused.
+            if not os.path.isdir(config.tstdir):
+                raise IOError('Test directory "%s" is not present.' % config.tstdir)
+        else:
+            if os.path.isdir(config.tstdir):
+                raise IOError('Test directory "%s" is already present.' % config.tstdir)
+            os.mkdir(config.tstdir)
+            if os.path.islink(config.lastlink):
+                self.prev_tstdir = os.readlink(config.lastlink)
+                os.remove(config.lastlink)
+            if not os.path.isfile(config.lastlink):
+                os.symlink(config.tstdir, config.lastlink)
         # Make a list of all test input files.
-        self.test_inputs = find_inputs(config.indir)
+        self.test_inputs = find_inputs(config.indir, config.nproc, config.indexfile)
         # Translate the dependency strings into dependency test_inputs.
         lookup = dict((test_input.path_inp, test_input) for test_input in self.test_inputs)
         for test_input in self.test_inputs:
@@ -97,4 +205,4 @@ class LastWork(object):
         if not os.path.isdir(config.tstdir):
             raise IOError('Test directory "%s" is not present.' % config.tstdir)
         # Make a list of all test input files.
-        self.test_inputs = find_inputs(config.tstdir)
+        self.test_inputs = find_inputs(config.tstdir, config.nproc, config.indexfile)
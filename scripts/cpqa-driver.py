@@ -20,22 +20,67 @@
 # --
 
 
-import sys, os, shutil, datetime, cPickle, traceback
+import sys, os, re, shutil, datetime, traceback, subprocess, signal, \
+    time, threading
 from optparse import OptionParser
 
-from cpqa import TestInput, TestResult, harvest_test, Timer, tail
+from cpqa import TestInput, TestResult, harvest_test, harvest_ref, \
+    update_refcache, Timer, tail, OutputFile, Harvester, OutputFollower, \
+    open_store, copy_file, link_file, find_output, find_covered, dump_pickle
 
 
 usage = """Usage: %prog bin tstpath refdir [mpi_prefix]
+       %prog --worker
 
 This script is called by cpqa-main.py to run a test job and validate the output.
 It should not be used directly.
+
+In worker mode, the script reads jobs from the standard input, one per line. Each
+line contains the command line arguments of a job, separated by tabs. After each
+job, a line 'CPQA-DONE retcode' is written to the standard output.
 """
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = OptionParser(usage)
-    (options, args) = parser.parse_args()
+    parser.add_option(
+        '--worker', default=False, action='store_true',
+        help='Keep running and read jobs from the standard input.'
+    )
+    parser.add_option(
+        '--stream', default=False, action='store_true',
+        help='Harvest the output while the test is running.'
+    )
+    parser.add_option(
+        '--abort-on-divergence', default=False, action='store_true',
+        help='Harvest the output while the test is running and kill the test '
+        'as soon as a value deviates from the reference beyond the divergence '
+        'tolerance.'
+    )
+    parser.add_option(
+        '--divergence-tolerance', type='float', default=1e-6,
+        help='The relative deviation from the reference at which the test is '
+        'killed with --abort-on-divergence.'
+    )
+    parser.add_option(
+        '--timeout', type='float',
+        help='Kill the test when it runs longer than the given number of seconds.'
+    )
+    parser.add_option(
+        '--coverage', default=False, action='store_true',
+        help='Record the source files that are executed by a binary with gcov '
+        'instrumentation.'
+    )
+    parser.add_option(
+        '--link', default=False, action='store_true',
+        help='Hard link the files of a new or reset test into the reference '
+        'directory instead of copying them.'
+    )
+    (options, args) = parser.parse_args(argv)
+    if options.worker:
+        if len(args) != 0:
+            raise TypeError('Expecting no arguments in worker mode.')
+        return options, None
     if len(args) == 3:
         bin, path_inp, refdir = args
         mpi_prefix = ''
@@ -43,7 +88,7 @@ def parse_args():
         bin, path_inp, refdir, mpi_prefix = args
     else:
         raise TypeError('Excpecting three or four arguments.')
-    return bin, path_inp, refdir, mpi_prefix
+    return options, (bin, path_inp, refdir, mpi_prefix)
 
 
 def print_log_line(path_inp, flags, sec_bin, sec_all):
@@ -60,7 +105,18 @@ def print_log_line(path_inp, flags, sec_bin, sec_all):
     print path_inp
 
 
-def run_test(bin, mpi_prefix, test_input):
+def kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        # The process group is already gone.
+        pass
+
+
+def run_test(bin, mpi_prefix, test_input, follower=None, abort=None, timeout=None,
+             env=None):
+    # When abort is not None, it is the tolerance for the divergence of the
+    # test output from the reference output.
     dirname, fn_inp = os.path.split(test_input.path_inp)
     fn_out = os.path.basename(test_input.path_out)
     fn_stdout = os.path.basename(test_input.path_stdout)
@@ -69,42 +125,89 @@ def run_test(bin, mpi_prefix, test_input):
         dirname, mpi_prefix, bin, fn_inp, fn_out, fn_stdout, fn_stderr
     )
     timer_bin = Timer()
-    retcode = os.system(command)
+    # The test runs in its own process group, such that it can be killed with
+    # all its child processes.
+    p = subprocess.Popen(command, shell=True, preexec_fn=os.setsid, env=env)
+    aborted = False
+    timed_out = []
+    killer = None
+    if timeout is not None:
+        def on_timeout():
+            timed_out.append(True)
+            kill_group(p.pid)
+        killer = threading.Timer(timeout, on_timeout)
+        # The timer must not keep the driver alive after an interrupt.
+        killer.daemon = True
+        killer.start()
+    try:
+        if follower is None:
+            retcode = p.wait()
+        else:
+            while True:
+                retcode = p.poll()
+                follower.update(retcode is not None)
+                if retcode is not None:
+                    break
+                if abort is not None and not aborted:
+                    for test in test_input.tests:
+                        if test.diverged(abort):
+                            kill_group(p.pid)
+                            aborted = True
+                            break
+                time.sleep(0.05)
+    except KeyboardInterrupt:
+        kill_group(p.pid)
+        raise
+    finally:
+        if killer is not None:
+            killer.cancel()
     timer_bin.stop()
-    return retcode, timer_bin
+    return retcode, timer_bin, aborted, len(timed_out) > 0
 
 
 def find_mem_leaks(fn_stderr):
-    result = False
-    f = open(fn_stderr)
-    for line in f:
-        if line.startswith('Remaining memory:'):
-            result = True
-            break
-    f.close()
+    # The standard error is missing when the shell did not get to the test.
+    if not os.path.isfile(fn_stderr):
+        return False
+    output = OutputFile(fn_stderr)
+    result = re.search('^Remaining memory:', output.data, re.MULTILINE) is not None
+    output.close()
     return result
 
 
-def main():
+def add_to_store(dirname, test_result, path_pp):
+    store = open_store(dirname)
+    if store is None:
+        return
+    try:
+        store.add(test_result, path_pp)
+    except Exception:
+        # The pickle file is the complete record. The runner adds missing
+        # results to the store.
+        pass
+    store.close()
+
+
+def copy_output(path, dstdir, copy):
+    # A compressed version of an older reference output must not remain next
+    # to the new output.
+    path_gz = os.path.join(dstdir, os.path.basename(path) + '.gz')
+    if os.path.isfile(path_gz):
+        os.remove(path_gz)
+    copy(find_output(path), dstdir)
+
+
+def run_job(options, bin, path_inp, refdir, mpi_prefix):
     timer_all = Timer()
-    # Get command line arguments
-    bin, path_inp, refdir, mpi_prefix = parse_args()
     test_input = TestInput('./', path_inp)
     refdir = os.path.join('..', refdir)
     # Flags to display the status of the test.
     flags = {}
+    # Results from the cache and skipped jobs are marked by the runner.
+    flags['cached'] = False
+    flags['skipped'] = False
     # To record error messages of this script:
     messages = []
-    # Run test job
-    retcode, timer_bin = run_test(bin, mpi_prefix, test_input)
-    flags['failed'] = (retcode != 0)
-    # Get the last 20 lines
-    last_out_lines = tail(test_input.path_out)
-    last_stdout_lines = tail(test_input.path_stdout)
-    last_stderr_lines = tail(test_input.path_stderr)
-    flags['verbose'] = len(last_stderr_lines) > 0 or len(last_stdout_lines) > 0
-    # Detect memory leaks in teh stderr
-    flags['leak'] = find_mem_leaks(test_input.path_stderr)
     # Check on refdir
     flags['new'] = not os.path.isfile(os.path.join(refdir, test_input.path_pp))
     # Extract the tests and count the number of resets
@@ -114,13 +217,51 @@ def main():
         test_input_ref = TestInput(refdir, path_inp)
         num_resets_ref = test_input_ref.num_resets
     flags['reset'] = (test_input.num_resets > num_resets_ref)
+    # Optionally harvest the output while the test is running. A test that
+    # resets its reference is expected to deviate from it and is not aborted.
+    follower = None
+    abort = None
+    if options.stream or options.abort_on_divergence:
+        if options.abort_on_divergence and not (flags['new'] or flags['reset']):
+            for test in test_input.tests:
+                test.follow()
+            harvest_ref(test_input, refdir, messages, use_cache=False)
+            abort = options.divergence_tolerance
+        fragments = [test.tst for test in test_input.tests if hasattr(test, 'tst')]
+        follower = OutputFollower(test_input.path_out, Harvester(fragments))
+    # The counters of an instrumented binary are written in a separate
+    # directory for each job.
+    env = None
+    if options.coverage:
+        path_gcov = os.path.abspath(test_input.path_coverage + '.gcov')
+        env = dict(os.environ)
+        env['GCOV_PREFIX'] = path_gcov
+        env['GCOV_PREFIX_STRIP'] = '0'
+    # Run test job
+    retcode, timer_bin, aborted, timed_out = run_test(
+        bin, mpi_prefix, test_input, follower, abort, options.timeout, env
+    )
+    if options.coverage:
+        dump_pickle(test_input.path_coverage, find_covered(path_gcov))
+        if os.path.isdir(path_gcov):
+            shutil.rmtree(path_gcov)
+    flags['failed'] = (retcode != 0)
+    flags['aborted'] = aborted
+    flags['timeout'] = timed_out
+    # Get the last 20 lines
+    last_out_lines = tail(test_input.path_out)
+    last_stdout_lines = tail(test_input.path_stdout)
+    last_stderr_lines = tail(test_input.path_stderr)
+    flags['verbose'] = len(last_stderr_lines) > 0 or len(last_stdout_lines) > 0
+    # Detect memory leaks in teh stderr
+    flags['leak'] = find_mem_leaks(test_input.path_stderr)
     flags['error'] = False
     if test_input.num_resets < num_resets_ref:
         flags['error'] = True
         messages.append('Error: The number of reset directives decreased.')
     # Collect fragments from output for tests.
     flags['missing'] = False
-    harvest_test(test_input, refdir, flags['new'], messages)
+    harvest_test(test_input, refdir, flags['new'], messages, follower is not None)
     # Do the actual tests.
     flags['wrong'] = False
     flags['different'] = False
@@ -141,31 +282,68 @@ def main():
     # Determine the OK flag
     flags['ok'] = not (flags['wrong'] or (flags['different'] and not
                   flags['reset']) or flags['missing'] or flags['failed'] or
-                  flags['error'] or flags['leak'])
+                  flags['error'] or flags['leak'] or flags['aborted'] or
+                  flags['timeout'])
     # Write the TestResult to a pickle file
     timer_all.stop()
     test_result = TestResult(
         path_inp, flags, timer_bin.seconds, timer_all.seconds,
         test_input.tests, messages, last_out_lines, last_stdout_lines,
-        last_stderr_lines
+        last_stderr_lines, options.timeout
     )
-    f = open(test_input.path_pp, 'w')
-    cPickle.dump(test_result, f, -1)
-    f.close()
+    dump_pickle(test_input.path_pp, test_result)
+    add_to_store('.', test_result, test_input.path_pp)
     # Copy the tests to the reference directory if needed.
     if (flags['new'] or flags['reset']) and flags['ok']:
         dstdir = os.path.join(refdir, os.path.dirname(test_input.path_pp))
         if not os.path.isdir(dstdir):
             os.makedirs(dstdir)
-        shutil.copy(path_inp, dstdir)
-        shutil.copy(test_input.path_out, dstdir)
-        shutil.copy(test_input.path_pp, dstdir)
-        shutil.copy(test_input.path_stderr, dstdir)
-        shutil.copy(test_input.path_stdout, dstdir)
+        if options.link:
+            copy = link_file
+        else:
+            copy = copy_file
+        copy(path_inp, dstdir)
+        copy_output(test_input.path_out, dstdir, copy)
+        copy(test_input.path_pp, dstdir)
+        copy_output(test_input.path_stderr, dstdir, copy)
+        copy_output(test_input.path_stdout, dstdir, copy)
+        update_refcache(test_input, refdir)
+        add_to_store(refdir, test_result, os.path.join(refdir, test_input.path_pp))
     # Print some screen output.
     print_log_line(path_inp, flags, timer_bin.seconds, timer_all.seconds)
 
 
+def run_worker():
+    # Keep the jobs for this worker away from the test runs, which get an empty
+    # standard input instead.
+    f_jobs = os.fdopen(os.dup(0))
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    while True:
+        line = f_jobs.readline()
+        if len(line) == 0:
+            break
+        retcode = 0
+        try:
+            options, args = parse_args(line[:-1].split('\t'))
+            run_job(options, *args)
+        except (Exception, SystemExit):
+            traceback.print_exc(file=sys.stdout)
+            retcode = 1
+        print 'CPQA-DONE %i' % retcode
+        sys.stdout.flush()
+    f_jobs.close()
+
+
+def main():
+    # Get command line arguments
+    options, args = parse_args()
+    if options.worker:
+        run_worker()
+    else:
+        run_job(options, *args)
+
 
 if __name__ == '__main__':
     # Only run main when this script is executed as a program, i.e. not imported
@@ -27,7 +27,7 @@ from cpqa import Config, compile_program, Work, Runner, log_txt, log_html, Timer
     import_main, update_source
 
 
-usage = """Usage: %prog [options] [input1.inp input2.inp ...] [directory1 directory2 ...] [fast:n|slow:n]
+usage = """Usage: %prog [options] [input1.inp input2.inp ...] [directory1 directory2 ...] [fast:n|slow:n] [shard:k/n] [changed:x] [budget:x]
 
 The order of the command line arguments does not matter. If no arguments are
 given, all tests are executed.
@@ -44,6 +44,48 @@ def parse_args():
         "--no-import", default=True, action='store_false', dest='do_import',
         help="Do not import tests from the source tree",
     )
+    parser.add_option(
+        "--stream", default=False, action='store_true',
+        help="Harvest the outputs while the tests are running",
+    )
+    parser.add_option(
+        "--abort-on-divergence", default=False, action='store_true',
+        help="Harvest the outputs while the tests are running and kill a test "
+        "as soon as a value deviates from the reference beyond the divergence "
+        "tolerance",
+    )
+    parser.add_option(
+        "--divergence-tolerance", type='float', default=1e-6, metavar='TOL',
+        help="The relative deviation from the reference at which a test is "
+        "killed with --abort-on-divergence [default=%default]",
+    )
+    parser.add_option(
+        "--resume", default=False, action='store_true',
+        help="Continue the last test run, e.g. after an interruption. Only the "
+        "tests without a result are executed. The tests are not imported "
+        "and the source code is not updated",
+    )
+    parser.add_option(
+        "--failed-first", default=False, action='store_true',
+        help="Run the tests that did not pass in the previous run first",
+    )
+    parser.add_option(
+        "--exitfirst-on", type='int', metavar='N',
+        help="Stop launching tests after N tests did not pass. The remaining "
+        "tests are skipped",
+    )
+    parser.add_option(
+        "--deadline", type='float',
+        help="Finish all test jobs within the given number of seconds after "
+        "the start. Jobs that are not expected to finish in time are skipped "
+        "and running jobs are killed at the deadline. Keep some time for the "
+        "report after the deadline",
+    )
+    parser.add_option(
+        "--record-coverage", default=False, action='store_true',
+        help="Record which source files are executed by each test. This "
+        "requires a binary compiled with gcov instrumentation",
+    )
     (options, args) = parser.parse_args()
     return options, args
 
@@ -53,9 +95,10 @@ def main():
     # Measure the total wall-time
     timer = Timer()
     # Load the configuration (from config.py file).
-    config = Config(args)
-    # Optionally import tests from the source tree.
-    if options.do_import:
+    config = Config(args, use_last=options.resume, options=options)
+    # Optionally import tests from the source tree. When a test run is
+    # resumed, the inputs must not change.
+    if options.do_import and not options.resume:
         import_main(config)
     # Parse the command line after the import to check the presence of the
     # selected inputs
@@ -63,7 +106,8 @@ def main():
     # Initialize the working directory.
     work = Work(config)
     # Update the source code
-    update_source(config)
+    if not options.resume:
+        update_source(config)
     # Try to compile the program
     compile_program(config)
     # Create a test runner. It will produce a Makefile based on the #CPQA
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import sys
+from optparse import OptionParser
+
+from cpqa import Config, MergedRun, log_txt, log_html
+
+
+usage = """Usage: %prog tstdir1 tstdir2 ...
+
+Merges the test directories of several runs into one new test directory and
+writes a combined report. This is useful when the test suite was split over
+several machines with the shard:k/n argument of cpqa-main.py. The test
+directories must be copied into the current working directory first, which
+must also contain the config.py file and the reference directory.
+
+The reference outputs of new and reset tests that passed in one of the runs are
+copied from the test directories into the reference directory, such that the
+next runs do not treat these tests as new again.
+
+The new test directory also becomes the last test run, such that it can be used
+with cpqa-reset.py.
+"""
+
+
+def parse_args():
+    parser = OptionParser(usage)
+    (options, args) = parser.parse_args()
+    if len(args) == 0:
+        raise TypeError('Expecting at least one test directory.')
+    return args
+
+
+def main():
+    tstdirs = parse_args()
+    # Load the configuration (from config.py file).
+    config = Config([])
+    config.parse_args()
+    # Merge the test directories and collect all test results.
+    merged = MergedRun(config, tstdirs)
+    # Print a summary on screen
+    log_txt(merged, merged.timer, sys.stdout)
+    # Create a text log file
+    log_txt(merged, merged.timer)
+    # Create a html log file
+    log_html(merged, merged.timer)
+
+
+if __name__ == '__main__':
+    # Only run main when this script is executed as a program, i.e. not imported
+    # as a module.
+    main()
@@ -20,10 +20,10 @@
 # --
 
 
-import os, sys, tempfile, cPickle
+import os, sys, tempfile
 from optparse import OptionParser
 
-from cpqa import Config, LastWork
+from cpqa import Config, LastWork, load_results
 
 
 usage = """Usage: %prog [options] [input1.inp input2.inp ...] [directory1 directory2 ...]
@@ -91,17 +91,19 @@ def get_different(config):
     test_inputs = config.filter_inputs_name(last_work.test_inputs)
     # Select those tests where the comparison with the reference number failed,
     # but that showed no other problems.
+    # Only the flags are needed.
+    results = load_results(config.tstdir, test_inputs)
     different = []
     for test_input in test_inputs:
-        fn = os.path.join(config.tstdir, test_input.path_pp)
-        if os.path.isfile(fn):
-            f = file(fn)
-            tst_result = cPickle.load(f)
-            f.close()
+        tst_result = results.get(test_input)
+        if tst_result is not None:
             if not tst_result.flags['different']:
                 continue
+            # Informational flags do not indicate other problems. Cached results
+            # can be reset like the others.
             del tst_result.flags['different']
             del tst_result.flags['verbose']
+            tst_result.flags.pop('cached', None)
             if any(tst_result.flags.itervalues()):
                 continue
             different.append(test_input)
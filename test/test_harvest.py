@@ -0,0 +1,68 @@
+# CPQA is a Quality Assurance framework for CP2K.
+# Copyright (C) 2010 Toon Verstraelen <Toon.Verstraelen@UGent.be>.
+#
+# This file is part of CPQA.
+#
+# CPQA is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# CPQA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os, tempfile, unittest
+
+from cpqa.harvest import Harvester
+from cpqa.output import OutputFile
+from cpqa.tests import ScalarFragment
+
+
+class HarvestTestCase(unittest.TestCase):
+    def harvest(self, data, regex):
+        # Return the lines found by Harvester.harvest and by feeding every line
+        # to the fragment.
+        fd, path = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+        try:
+            fragment = ScalarFragment(regex, 1)
+            output = OutputFile(path)
+            Harvester([fragment]).harvest(output)
+            output.close()
+        finally:
+            os.remove(path)
+        fragment_lines = ScalarFragment(regex, 1)
+        for line in data.splitlines(True):
+            fragment_lines.feed(line)
+        return fragment.lines, fragment_lines.lines
+
+    def check(self, data, regex):
+        harvested, fed = self.harvest(data, regex)
+        self.assertEqual(harvested, fed)
+        self.assertEqual(len(fed), 1)
+
+    def test_plain(self):
+        self.check('x\nENERGY 1.0\nnext\n', 'ENERGY')
+
+    def test_lookbehind(self):
+        # The newline before the line is a space in the whole file.
+        self.check('x\nENERGY 1.0\nnext\n', '(?<!\\s)ENERGY')
+
+    def test_negative_lookahead(self):
+        self.check('x\nENERGY 1.0\nnext\n', 'ENERGY(?!.*\\n.*next)')
+
+    def test_end_after_newline(self):
+        self.check('x\nENERGY 1.0\nnext\n', '1.0\\s$')
+
+
+if __name__ == '__main__':
+    unittest.main()